@@ -0,0 +1,129 @@
+import hashlib
+import os
+
+from PIL import Image, ImageDraw
+
+from util import ImageUtil
+
+# Decoded assets of the current process, see AssetUtil.Preload
+_assets = {}
+
+
+def create_border_layer(card_size, border_size=10, radius=0, fillcolor='yellow'):
+    width, height = card_size
+    border_layer = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(border_layer)
+    draw.rounded_rectangle([0, 0, width, height], radius, fill=fillcolor)
+    inner_rect = [border_size, border_size, width - border_size, height - border_size]
+    draw.rounded_rectangle(inner_rect, radius - border_size, fill=(0, 0, 0, 0))
+
+    return border_layer
+
+
+def create_rounded_rectangle_mask(image_width, image_height, radius):
+    mask = Image.new('L', (image_width, image_height), 0)
+    draw = ImageDraw.Draw(mask)
+
+    draw.rounded_rectangle([(0, 0), (image_width, image_height)], radius=radius, fill=255)
+
+    return mask
+
+
+class AssetUtil:
+    """
+    Class containing the static assets shared by every card.
+
+    Assets are decoded once per process and returned as shared images, which
+    must be treated as read-only.
+    """
+
+    def Preload(self):
+        """
+        Load the assets used by every card, intended to be used as the
+        initializer of the card rendering pool.
+        """
+
+        AssetUtil.VBucks(self)
+
+        for size in (24, 26, 30, 36, 56):
+            ImageUtil.Font(self, size)
+
+        for gridSize in range(1, 5):
+            size = (340 * gridSize, 545)
+
+            AssetUtil.RoundedMask(self, size, 40)
+            AssetUtil.Border(self, size, "yellow")
+            AssetUtil.Border(self, size, "red")
+
+    def Version(self):
+        """
+        Return a digest of the size and modification time of every image and
+        font asset, which changes whenever an asset is edited.
+        """
+
+        if "version" not in _assets:
+            _assets["version"] = AssetUtil.Digest(self)
+
+        return _assets["version"]
+
+    def Digest(self):
+        """Return the current digest of the asset files, see AssetUtil.Version."""
+
+        digest = hashlib.sha256()
+
+        for directory in ("assets/images/", "assets/fonts/"):
+            for filename in sorted(os.listdir(directory)):
+                stat = os.stat(f"{directory}{filename}")
+                digest.update(f"{filename}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+
+        return digest.hexdigest()
+
+    def Reload(self):
+        """
+        Forget the decoded assets and fonts of the current process if any
+        asset was edited since they were loaded, so they are loaded again.
+
+        Return True if the assets were forgotten.
+        """
+
+        digest = AssetUtil.Digest(self)
+
+        if _assets.get("version") == digest:
+            return False
+
+        _assets.clear()
+        ImageUtil.ClearCaches(self)
+        _assets["version"] = digest
+
+        return True
+
+    def VBucks(self):
+        """Return the V-Bucks icon, resized for the card price and banner."""
+
+        if "vbucks" not in _assets:
+            vbucks = ImageUtil.Open(self, "vbucks.png")
+            _assets["vbucks"] = ImageUtil.RatioResize(self, vbucks, 25, 25)
+
+        return _assets["vbucks"]
+
+    def RoundedMask(self, size: tuple, radius: int):
+        """Return the rounded rectangle mask of the specified size and corner radius."""
+
+        key = ("mask", size, radius)
+
+        if key not in _assets:
+            _assets[key] = create_rounded_rectangle_mask(size[0], size[1], radius)
+
+        return _assets[key]
+
+    def Border(self, size: tuple, color: str):
+        """Return the highlighted card border of the specified size and color."""
+
+        key = ("border", size, color)
+
+        if key not in _assets:
+            _assets[key] = create_border_layer(
+                size, border_size=13, radius=40, fillcolor=color
+            )
+
+        return _assets[key]
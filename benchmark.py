@@ -0,0 +1,512 @@
+"""
+Offline benchmark of the Item Shop image generation.
+
+A local HTTP server stands in for fortnite-api.com and its image CDN, serving
+either a recorded /v2/shop payload or a generated one, along with the icons it
+references. Every run happens in a fresh process, so peak memory and warm-up
+costs are measured the same way as a scheduled run.
+
+    python3 benchmark.py --record recording/
+    python3 benchmark.py --recording recording/ --sizes 30 150 500 --repeat 3
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import perf_counter, sleep
+from urllib.parse import parse_qs, urlsplit
+
+log = logging.getLogger(__name__)
+
+# Keys of a shop entry which hold the items it contains
+ITEM_KEYS = ("brItems", "legoKits", "instruments", "cars")
+
+
+class Recording:
+    """Class containing a /v2/shop payload and the icons it references."""
+
+    def __init__(self, shop: dict, icons: dict):
+        self.shop = shop
+        self.icons = icons
+
+    def Record(directory: str):
+        """Record the live Item Shop and every icon it references into the specified directory."""
+
+        import requests
+
+        res = requests.get(
+            "https://fortnite-api.com/v2/shop", params={"responseFlags": 5}
+        )
+        res.raise_for_status()
+        shop = res.json()["data"]
+
+        os.makedirs(os.path.join(directory, "icons"), exist_ok=True)
+
+        urls = set()
+        Recording.Rewrite(shop, lambda url: urls.add(url) or url)
+
+        for url in sorted(urls):
+            path = os.path.join(directory, "icons", Recording.Name(url))
+
+            if os.path.exists(path):
+                continue
+
+            try:
+                icon = requests.get(url)
+            except requests.RequestException as e:
+                log.warning(f"Failed to record {url}, {e}")
+                continue
+
+            if icon.status_code == 200:
+                with open(path, "wb") as file:
+                    file.write(icon.content)
+
+        with open(os.path.join(directory, "shop.json"), "w", encoding="utf-8") as file:
+            json.dump(shop, file)
+
+        log.info(f"Recorded {len(shop['entries'])} entries and {len(urls)} icons to {directory}")
+
+    def Load(directory: str):
+        """Return the recording stored in the specified directory."""
+
+        with open(os.path.join(directory, "shop.json"), "r", encoding="utf-8") as file:
+            shop = json.load(file)
+
+        icons = {}
+        for filename in os.listdir(os.path.join(directory, "icons")):
+            with open(os.path.join(directory, "icons", filename), "rb") as file:
+                icons[filename] = file.read()
+
+        return Recording(shop, icons)
+
+    def Generate(size: int, seed: int = 0):
+        """Return a generated recording with the specified number of entries."""
+
+        from PIL import Image, ImageDraw
+
+        rnd = random.Random(seed)
+        today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        sections = [
+            ("Spotlight", "Spotlight"),
+            ("Icon Series", "Icon Series"),
+            ("Jam Tracks", "Festival"),
+            ("Build with LEGO® Kits", "Build with LEGO® Kits"),
+            ("Rocket Racing", "Rocket Racing"),
+            ("Marvel", None),
+            ("Star Wars", None),
+        ]
+        names = ["Jonesy", "Peely", "Midas", "Drift", "Fishstick", "Raven", "The Dark Lord of the Sith", "Galactic Explorer"]
+        colors = ["ff00aaff", "1b3d8aff", "f2c94cff", "2f9e44ff", "862e9cff", "c92a2aff"]
+        shop = {"date": today.strftime("%Y-%m-%dT%H:%M:%SZ"), "entries": []}
+        icons = {}
+
+        # Every url is unique, but their contents are drawn from a small pool
+        pool = []
+        for _ in range(48):
+            width = rnd.choice([512, 1024, 2048])
+            image = Image.new("RGBA", (width, width))
+            draw = ImageDraw.Draw(image)
+            color = tuple(rnd.randrange(256) for _ in range(3))
+            draw.ellipse([width // 8, width // 16, width * 7 // 8, width], fill=color)
+            draw.rectangle([width // 3, width // 4, width * 2 // 3, width // 2], fill=color[::-1])
+            buffer = io.BytesIO()
+            image.save(buffer, "PNG", compress_level=1)
+            pool.append(buffer.getvalue())
+
+        def icon(kind: str):
+            name = f"{kind}{len(icons)}.png"
+            icons[name] = pool[len(icons) % len(pool)]
+
+            return f"/icons/{name}"
+
+        for i in range(size):
+            key = rnd.choice(["brItems"] * 5 + ["bundle", "legoKits", "instruments", "cars"])
+            name = f"{rnd.choice(names)} {i}"
+            history = sorted(
+                {
+                    (today - timedelta(days=rnd.choice([0, 1, 2, 3, 14, 90, 320, rnd.randrange(900)]))).strftime("%Y-%m-%dT%H:%M:%SZ")
+                    for _ in range(rnd.randrange(1, 12))
+                }
+                | {today.strftime("%Y-%m-%dT%H:%M:%SZ")}
+            )
+            section, category = {
+                "bundle": sections[1],
+                "legoKits": sections[3],
+                "instruments": sections[2],
+                "cars": sections[4],
+            }.get(key, rnd.choice(sections[:2] + sections[5:]))
+            layout = {"id": section.replace(" ", ""), "name": section}
+            if category is not None:
+                layout["category"] = category
+
+            item = {
+                "id": f"Item_{i}",
+                "name": name,
+                "type": {"value": {
+                    "legoKits": rnd.choice(["legoprop", "legoset"]),
+                    "instruments": rnd.choice(["guitar", "bass", "drum"]),
+                    "cars": rnd.choice(["body", "wheel", "booster"]),
+                }.get(key, rnd.choice(["outfit", "outfit", "emote", "wrap", "pickaxe", "backpack", "shoe"]))},
+                "rarity": {"value": rnd.choice(["uncommon", "rare", "epic", "legendary", "icon", "marvel", "gaminglegends"])},
+                "images": {"smallIcon": icon("small"), "icon": icon("icon"), "featured": icon("featured"), "small": icon("small"), "large": icon("large")},
+                "shopHistory": history,
+            }
+            entry = {
+                "regularPrice": 1500,
+                "finalPrice": rnd.choice([500, 800, 1200, 1500, 2000, 2800]),
+                "offerId": f"v2:/{hashlib.sha1(str(i).encode()).hexdigest()}",
+                "inDate": shop["date"],
+                "outDate": (today + timedelta(days=rnd.randrange(1, 4))).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "sortPriority": rnd.randrange(-10, 100),
+                "tileSize": f"Size_{rnd.choice([1, 1, 1, 2, 2, 3, 4])}_x_2",
+                "layoutId": f"{layout['id']}.{i % 5}",
+                "layout": layout,
+                "colors": {"color1": rnd.choice(colors), "color3": rnd.choice(colors)},
+                "newDisplayAsset": {"renderImages": [{"image": icon("render")}]},
+                ITEM_KEYS[0] if key == "bundle" else key: [item],
+            }
+            if rnd.random() < 0.5:
+                entry["colors"]["color2"] = rnd.choice(colors)
+            if key == "bundle":
+                entry["bundle"] = {"name": name.upper(), "info": "Bundle", "image": icon("bundle")}
+            if rnd.random() < 0.25:
+                entry["banner"] = {"value": rnd.choice(["New!", "500 V-Bucks Off", "Sale"]), "backendValue": "Banner"}
+
+            shop["entries"].append(entry)
+
+        return Recording(shop, icons)
+
+    def Name(url: str):
+        """Return the file name an icon url is recorded under."""
+
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def Rewrite(value, replace):
+        """Return a copy of the provided payload with every icon url replaced."""
+
+        if isinstance(value, dict):
+            return {key: Recording.Rewrite(item, replace) for key, item in value.items()}
+        elif isinstance(value, list):
+            return [Recording.Rewrite(item, replace) for item in value]
+        elif isinstance(value, str) and value.startswith(("http://", "https://", "/icons/")):
+            return replace(value)
+
+        return value
+
+    def Resize(self, size: int, seed: int = 0):
+        """
+        Return the payload of this recording with the specified number of
+        entries, sampling entries again when more are requested than recorded.
+        """
+
+        rnd = random.Random(seed)
+        entries = list(self.shop["entries"])
+
+        while len(entries) < size:
+            entry = json.loads(json.dumps(rnd.choice(self.shop["entries"])))
+            entry["offerId"] = f"{entry.get('offerId')}:{len(entries)}"
+            entries.append(entry)
+
+        return dict(self.shop, entries=entries[:size])
+
+
+class Server:
+    """Local stand-in for fortnite-api.com and its image CDN."""
+
+    def __init__(self, recording: Recording, recorded: bool):
+        self.recording = recording
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Server.Handler(self))
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+        # Point every icon of the payload at this server
+        if recorded is True:
+            self.shop = Recording.Rewrite(
+                recording.shop, lambda url: f"{self.url}/icons/{Recording.Name(url)}"
+            )
+        else:
+            self.shop = Recording.Rewrite(recording.shop, lambda url: f"{self.url}{url}")
+
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def Handler(server):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urlsplit(self.path)
+
+                if url.path == "/v2/shop":
+                    size = int(parse_qs(url.query).get("size", [len(server.shop["entries"])])[0])
+                    recording = Recording(server.shop, server.recording.icons)
+                    body = json.dumps({"status": 200, "data": recording.Resize(size)}).encode("utf-8")
+                    contentType = "application/json"
+                elif url.path.startswith("/icons/") and url.path[7:] in server.recording.icons:
+                    body = server.recording.icons[url.path[7:]]
+                    contentType = "image/png"
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", contentType)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+class Sampler:
+    """Samples the combined memory of a process and all of its descendants."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.Run, daemon=True)
+        self.thread.start()
+
+    def Tree(self):
+        """Return the process id of the sampled process and its descendants."""
+
+        parents = {}
+        for pid in os.listdir("/proc"):
+            if pid.isdigit():
+                try:
+                    with open(f"/proc/{pid}/stat", "r") as file:
+                        parents[int(pid)] = int(file.read().rsplit(")", 1)[1].split()[1])
+                except (OSError, IndexError, ValueError):
+                    continue
+
+        tree = {self.pid}
+        changed = True
+        while changed:
+            changed = False
+            for pid, parent in parents.items():
+                if parent in tree and pid not in tree:
+                    tree.add(pid)
+                    changed = True
+
+        return tree
+
+    def RSS(self, pid: int):
+        """
+        Return the proportional resident memory of the specified process in
+        bytes, so pages shared with forked pool workers are only counted once.
+        """
+
+        for path, field in ((f"/proc/{pid}/smaps_rollup", "Pss:"), (f"/proc/{pid}/status", "VmRSS:")):
+            try:
+                with open(path, "r") as file:
+                    for line in file:
+                        if line.startswith(field):
+                            return int(line.split()[1]) * 1024
+            except OSError:
+                continue
+
+        return 0
+
+    def Run(self):
+        # Memory of the process tree can only be sampled on Linux
+        if not os.path.isdir("/proc"):
+            return
+
+        while self.running:
+            self.peak = max(self.peak, sum(self.RSS(pid) for pid in self.Tree()))
+            sleep(self.interval)
+
+    def Stop(self):
+        """Stop sampling and return the peak resident memory in bytes."""
+
+        self.running = False
+        self.thread.join()
+
+        return self.peak
+
+
+def Run(arguments):
+    """Generate a single Item Shop image and print its measurements as JSON."""
+
+    logging.disable(logging.WARNING if arguments.verbose is False else logging.NOTSET)
+
+    from itemshop import Athena
+    from util import Utility
+
+    configuration = {
+        "api": arguments.api,
+        "delayStart": 0,
+        "language": "en",
+        "discord": {"enabled": False, "TOKEN": None, "CHANNEL_ID": None},
+        "reddit": {
+            "enabled": False,
+            "client_id": None,
+            "client_secret": None,
+            "user_agent": None,
+            "username": None,
+            "password": None,
+            "sub_reddit": None,
+            "flair_id": None,
+        },
+        "cache": {"enabled": arguments.cache is not None, "directory": arguments.cache},
+    }
+    if arguments.configuration is not None:
+        with open(arguments.configuration, "r", encoding="utf-8") as file:
+            configuration.update(json.load(file))
+        configuration["api"] = arguments.api
+
+    start = perf_counter()
+
+    Athena.ApplyConfiguration(Athena, configuration)
+
+    with Athena.metrics.Span("fetch"):
+        itemShop = Utility.GET(Athena, f"{arguments.api}/v2/shop", {}, {"size": arguments.size})
+
+    with Athena.metrics.Span("parse"):
+        itemShop = json.loads(itemShop)["data"]
+        date = Utility.ISOtoHuman(Athena, itemShop["date"].split("T")[0], "en")
+
+    with Athena.metrics.Span("generate"):
+        shopImage = Athena.GenerateImage(Athena, date, itemShop)
+
+    Athena.metrics.Write(Athena.metricsReport, Athena.metricsPrometheus)
+
+    # Card spans of every worker overlap, so they are reported separately from the run stages
+    stages = {
+        name: stage["total"]
+        for name, stage in Athena.metrics.Stages().items()
+        if not name.startswith("card.")
+    }
+
+    print(
+        json.dumps(
+            {
+                "wall": perf_counter() - start,
+                "stages": stages,
+                "cards": {
+                    name: stage["total"]
+                    for name, stage in Athena.metrics.Stages().items()
+                    if name.startswith("card.")
+                },
+                "maxrss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+                "output": len(shopImage.data),
+            }
+        )
+    )
+
+
+def Benchmark(arguments):
+    """Run every requested shop size repeatedly and print a summary of the measurements."""
+
+    if arguments.recording is not None:
+        recording = Recording.Load(arguments.recording)
+    else:
+        recording = Recording.Generate(max(arguments.sizes), arguments.seed)
+
+    server = Server(recording, arguments.recording is not None)
+    repository = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+
+    for size in arguments.sizes:
+        runs = []
+
+        for iteration in range(arguments.repeat):
+            # Runs happen in an empty directory so outputs never overwrite real ones
+            with tempfile.TemporaryDirectory() as directory:
+                os.symlink(os.path.join(repository, "assets"), os.path.join(directory, "assets"))
+
+                command = [sys.executable, os.path.abspath(__file__), "--run", "--api", server.url, "--size", str(size)]
+                if arguments.cache is not None:
+                    command += ["--cache", os.path.abspath(arguments.cache)]
+                if arguments.configuration is not None:
+                    command += ["--configuration", os.path.abspath(arguments.configuration)]
+                if arguments.verbose is True:
+                    command += ["--verbose"]
+
+                env = dict(os.environ, PYTHONPATH=os.pathsep.join([repository, os.environ.get("PYTHONPATH", "")]))
+                process = subprocess.Popen(command, cwd=directory, env=env, stdout=subprocess.PIPE)
+                sampler = Sampler(process.pid)
+                stdout, _ = process.communicate()
+                peak = sampler.Stop()
+
+            if process.returncode != 0:
+                log.error(f"Run {iteration + 1} of size {size} failed with exit code {process.returncode}")
+                continue
+
+            run = json.loads(stdout.decode("utf-8").strip().splitlines()[-1])
+            run["peakRSS"] = max(peak, run["maxrss"])
+            runs.append(run)
+
+            log.info(
+                f"size {size} run {iteration + 1}: {run['wall']:.2f}s, peak RSS {run['peakRSS'] / 2**20:.0f} MiB, output {run['output'] / 2**20:.2f} MiB"
+            )
+
+        if len(runs) > 0:
+            results[size] = {
+                "runs": runs,
+                "wall": statistics.median(run["wall"] for run in runs),
+                "stages": {
+                    stage: statistics.median(run["stages"].get(stage, 0) for run in runs)
+                    for stage in dict.fromkeys(stage for run in runs for stage in run["stages"])
+                },
+                "peakRSS": max(run["peakRSS"] for run in runs),
+                "output": statistics.median(run["output"] for run in runs),
+            }
+
+    print(f"{'size':>6} {'wall (s)':>9} {'peak RSS (MiB)':>15} {'output (MiB)':>13}  stages (s, median)")
+    for size, result in results.items():
+        stages = ", ".join(f"{stage} {seconds:.2f}" for stage, seconds in result["stages"].items())
+        print(
+            f"{size:>6} {result['wall']:>9.2f} {result['peakRSS'] / 2**20:>15.0f} {result['output'] / 2**20:>13.2f}  {stages}"
+        )
+
+    if arguments.json is not None:
+        with open(arguments.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=4)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(message)s", datefmt="%I:%M:%S")
+
+    parser = argparse.ArgumentParser(description="Offline benchmark of the Item Shop image generation.")
+    parser.add_argument("--record", metavar="DIRECTORY", help="record the live Item Shop and its icons, then exit")
+    parser.add_argument("--recording", metavar="DIRECTORY", help="benchmark a recorded Item Shop instead of a generated one")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[30, 150, 500], help="number of shop entries of each benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs of each size")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated Item Shop")
+    parser.add_argument("--cache", metavar="DIRECTORY", help="enable the cache in the specified directory")
+    parser.add_argument("--configuration", metavar="FILE", help="configuration.json values to benchmark with")
+    parser.add_argument("--json", metavar="FILE", help="write every measurement to the specified file")
+    parser.add_argument("--verbose", action="store_true", help="show the log of each run")
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--api", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.record is not None:
+        Recording.Record(arguments.record)
+    elif arguments.run is True:
+        Run(arguments)
+    else:
+        Benchmark(arguments)
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+log = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """
+    Content-addressed disk cache with least-recently-used eviction.
+
+    Entries are keyed by an arbitrary string (usually a URL) and point at an
+    object file named after the SHA-256 of its contents, so identical images
+    served from different URLs are only stored once. Every write is atomic,
+    which allows concurrent readers and writers across processes.
+    """
+
+    def __init__(self, directory: str, maxSize: int):
+        self.directory = directory
+        self.maxSize = maxSize
+
+        os.makedirs(os.path.join(directory, "entries"), exist_ok=True)
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+
+    def EntryPath(self, key: str):
+        """Return the path of the metadata file for the specified key."""
+
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+        return os.path.join(self.directory, "entries", f"{digest}.json")
+
+    def ObjectPath(self, digest: str):
+        """Return the path of the object file for the specified content digest."""
+
+        return os.path.join(self.directory, "objects", digest[:2], digest)
+
+    def Get(self, key: str):
+        """
+        Return a tuple of the cached bytes and metadata for the specified key.
+
+        Return None if the key is not cached or was evicted by another process.
+        """
+
+        try:
+            with open(DiskCache.EntryPath(self, key), "r", encoding="utf-8") as file:
+                meta = json.load(file)
+            with open(DiskCache.ObjectPath(self, meta["object"]), "rb") as file:
+                data = file.read()
+        except (OSError, ValueError, KeyError):
+            return
+
+        DiskCache.Touch(self, key, meta)
+
+        return data, meta
+
+    def Contains(self, key: str):
+        """Return True if the specified key is cached."""
+
+        try:
+            with open(DiskCache.EntryPath(self, key), "r", encoding="utf-8") as file:
+                meta = json.load(file)
+
+            return os.path.exists(DiskCache.ObjectPath(self, meta["object"]))
+        except (OSError, ValueError, KeyError):
+            return False
+
+    def Touch(self, key: str, meta: dict):
+        """Mark the specified entry as recently used."""
+
+        try:
+            os.utime(DiskCache.EntryPath(self, key))
+            os.utime(DiskCache.ObjectPath(self, meta["object"]))
+        except OSError:
+            pass
+
+    def Put(self, key: str, data: bytes, meta: dict = {}):
+        """Store the provided bytes and metadata under the specified key."""
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = DiskCache.ObjectPath(self, digest)
+
+        try:
+            if os.path.exists(path):
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                DiskCache.WriteAtomic(self, path, data)
+
+            entry = dict(meta, key=key, object=digest, size=len(data))
+            DiskCache.WriteAtomic(
+                self, DiskCache.EntryPath(self, key), json.dumps(entry).encode("utf-8")
+            )
+        except OSError as e:
+            log.warning(f"Failed to write {key} to cache, {e}")
+
+    def WriteAtomic(self, path: str, data: bytes):
+        """Write the provided bytes to a temporary file and move it into place."""
+
+        handle, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            os.replace(temporary, path)
+        except Exception:
+            try:
+                os.remove(temporary)
+            except OSError:
+                pass
+
+            raise
+
+    def Prune(self):
+        """
+        Evict the least-recently-used objects until the cache fits within its
+        maximum size, then remove entries which point at evicted objects.
+
+        Only one process prunes at a time, others return immediately.
+        """
+
+        lock = os.path.join(self.directory, "prune.lock")
+
+        try:
+            # Locks left behind by a crashed process are considered stale
+            if time.time() - os.path.getmtime(lock) > 600:
+                os.remove(lock)
+        except OSError:
+            pass
+
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return
+
+        try:
+            objects = []
+            root = os.path.join(self.directory, "objects")
+
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+
+                    # Leftovers from interrupted writes
+                    if filename.endswith(".tmp"):
+                        if time.time() - stat.st_mtime > 600:
+                            try:
+                                os.remove(path)
+                            except OSError:
+                                pass
+                        continue
+
+                    objects.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in objects)
+            evicted = 0
+
+            for _, size, path in sorted(objects):
+                if total <= self.maxSize:
+                    break
+
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+
+                total -= size
+                evicted += 1
+
+            if evicted > 0:
+                entries = os.path.join(self.directory, "entries")
+
+                for filename in os.listdir(entries):
+                    path = os.path.join(entries, filename)
+
+                    try:
+                        with open(path, "r", encoding="utf-8") as file:
+                            digest = json.load(file)["object"]
+                        if not os.path.exists(DiskCache.ObjectPath(self, digest)):
+                            os.remove(path)
+                    except (OSError, ValueError, KeyError):
+                        continue
+
+                log.info(f"Evicted {evicted} objects from cache")
+        finally:
+            try:
+                os.remove(lock)
+            except OSError:
+                pass
@@ -0,0 +1,263 @@
+import io
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import NamedTuple
+
+from PIL import Image, features
+
+log = logging.getLogger(__name__)
+
+# File extension of each supported output format
+EXTENSIONS = {
+    "png": "png",
+    "png-palette": "png",
+    "webp": "webp",
+    "webp-lossless": "webp",
+    "jpeg": "jpg",
+}
+
+# Formats which have a quality setting to trade for file size
+LOSSY = ("webp", "jpeg")
+
+# Largest width or height WebP is able to encode
+WEBP_LIMIT = 16383
+
+
+class EncodedImage(NamedTuple):
+    """
+    Encoded Item Shop image, handed from rendering to the publishers in memory.
+
+    The full size image carries the smaller variants configured in the output
+    section, by name.
+    """
+
+    data: bytes
+    extension: str
+    filename: str
+    image: Image.Image = None
+    variants: dict = None
+
+
+class Encoder:
+    """Class containing the encoding of the Item Shop image."""
+
+    def Settings(self, configuration: dict):
+        """Return the encoder settings from the output section of configuration.json."""
+
+        settings = {
+            "format": configuration.get("format", "png"),
+            "compressLevel": configuration.get("compressLevel", 6),
+            "optimize": configuration.get("optimize", True),
+            "quality": configuration.get("quality", 90),
+            "maxBytes": configuration.get("maxBytes"),
+        }
+
+        if settings["format"] not in EXTENSIONS:
+            log.warning(f"Unsupported output format {settings['format']}, defaulting to png")
+
+            settings["format"] = "png"
+
+        return settings
+
+    def Save(self, image: Image.Image, settings: dict, quality: int = None):
+        """Return the provided image encoded with the specified settings."""
+
+        output = settings["format"]
+        quality = settings["quality"] if quality is None else quality
+        buffer = io.BytesIO()
+
+        if output == "png":
+            image.save(
+                buffer,
+                "PNG",
+                optimize=settings["optimize"],
+                compress_level=settings["compressLevel"],
+            )
+        elif output == "png-palette":
+            image.quantize(256, method=Image.FASTOCTREE).save(
+                buffer,
+                "PNG",
+                optimize=settings["optimize"],
+                compress_level=settings["compressLevel"],
+            )
+        elif output == "webp":
+            image.save(buffer, "WEBP", quality=quality, method=4)
+        elif output == "webp-lossless":
+            image.save(buffer, "WEBP", lossless=True, quality=quality, method=4)
+        elif output == "jpeg":
+            image.save(
+                buffer,
+                "JPEG",
+                quality=quality,
+                optimize=settings["optimize"],
+                progressive=True,
+            )
+
+        return buffer.getvalue()
+
+    def Encode(self, image: Image.Image, settings: dict):
+        """
+        Return the provided image encoded with the specified settings, and the
+        file extension of the format used.
+
+        If maxBytes is set, lossy formats search for the highest quality that
+        fits, while lossless formats are scaled down until they fit.
+        """
+
+        settings = dict(settings)
+
+        if settings["format"].startswith("webp"):
+            if not features.check("webp"):
+                log.warning("Pillow was built without WebP support, defaulting to png")
+
+                settings["format"] = "png"
+            elif max(image.size) > WEBP_LIMIT:
+                log.warning(f"Image exceeds the WebP size limit of {WEBP_LIMIT}px, defaulting to png")
+
+                settings["format"] = "png"
+
+        if settings["maxBytes"] is None:
+            data = Encoder.Timed(self, image, settings)
+        elif settings["format"] in LOSSY:
+            data = Encoder.FitQuality(self, image, settings)
+        else:
+            data = Encoder.FitScale(self, image, settings)
+
+        return data, EXTENSIONS[settings["format"]]
+
+    def Pyramid(self, image: Image.Image, widths: dict):
+        """
+        Return a dictionary of name to the provided image scaled down to each
+        of the provided maximum widths, from the widest to the narrowest.
+
+        Each level is scaled down from the previous one rather than from the
+        full size image, so the largest image is only resampled once.
+        """
+
+        levels = {}
+
+        for name, width in sorted(widths.items(), key=lambda level: level[1], reverse=True):
+            if image.width > width:
+                image = image.resize(
+                    (width, max(1, math.floor(image.height * width / image.width))),
+                    getattr(self, "resample", Image.LANCZOS),
+                )
+
+            levels[name] = image
+
+        return levels
+
+    def EncodeAll(self, tasks: list):
+        """
+        Return the encoded data and file extension of each of the provided
+        (image, settings), encoded in parallel.
+
+        Pillow releases the GIL while compressing, so threads encode at once.
+        """
+
+        if len(tasks) == 1:
+            return [Encoder.Encode(self, *tasks[0])]
+
+        with ThreadPoolExecutor(len(tasks)) as executor:
+            return list(executor.map(lambda task: Encoder.Encode(self, *task), tasks))
+
+    def Timed(self, image: Image.Image, settings: dict, quality: int = None):
+        """Return the provided image encoded with the specified settings, logging the time taken."""
+
+        start = perf_counter()
+        data = Encoder.Save(self, image, settings, quality)
+
+        described = settings["format"] if quality is None else f"{settings['format']} (quality {quality})"
+        log.info(
+            f"Encoded {image.width}x{image.height} {described} in {perf_counter() - start:.2f}s, {len(data):,} bytes"
+        )
+
+        return data
+
+    def FitQuality(self, image: Image.Image, settings: dict):
+        """
+        Return the provided image encoded at the highest quality which fits
+        within maxBytes.
+
+        Qualities are compared by encoding a probe made of evenly spaced strips
+        of the image, a sixteenth of its size. Each full size encode corrects
+        the estimate used to pick the next quality.
+        """
+
+        budget = settings["maxBytes"]
+        strips = 16
+        stripHeight = max(1, image.height // (strips * 16))
+        probe = Image.new(image.mode, (image.width, stripHeight * strips))
+        for i in range(strips):
+            top = (image.height - stripHeight) * i // (strips - 1)
+            probe.paste(image.crop((0, top, image.width, top + stripHeight)), (0, stripHeight * i))
+        pixels = image.height / probe.height
+        probes = {}
+
+        def estimate(quality: int):
+            if quality not in probes:
+                probes[quality] = len(Encoder.Save(self, probe, settings, quality)) * pixels
+
+            return probes[quality]
+
+        correction = 1
+        attempted = set()
+        best, bestQuality = None, 0
+
+        for _ in range(3):
+            low, high, quality = 1, settings["quality"], 1
+            while low <= high:
+                middle = (low + high) // 2
+
+                if estimate(middle) * correction <= budget:
+                    quality = middle
+                    low = middle + 1
+                else:
+                    high = middle - 1
+
+            if quality in attempted:
+                break
+            attempted.add(quality)
+
+            data = Encoder.Timed(self, image, settings, quality)
+            correction = len(data) / estimate(quality)
+
+            if len(data) <= budget and quality > bestQuality:
+                best, bestQuality = data, quality
+
+        if best is None:
+            log.warning(f"Failed to encode within {budget:,} bytes, scaling down instead")
+
+            return Encoder.FitScale(self, image, dict(settings, quality=1))
+
+        return best
+
+    def FitScale(self, image: Image.Image, settings: dict):
+        """Return the provided image encoded and scaled down until it fits within maxBytes."""
+
+        budget = settings["maxBytes"]
+        data = Encoder.Timed(self, image, settings)
+        scaled = image
+        scale = 1.0
+
+        while len(data) > budget:
+            # Encoded size is roughly proportional to the number of pixels,
+            # every pass is smaller than the last even when that is not so
+            scale *= min(math.sqrt(budget / len(data)) * 0.95, 0.95)
+            size = (max(1, math.floor(image.width * scale)), max(1, math.floor(image.height * scale)))
+
+            if size == scaled.size:
+                size = (max(1, scaled.width - 1), max(1, scaled.height - 1))
+
+                if size == scaled.size:
+                    break
+
+            scaled = image.resize(size, getattr(self, "resample", Image.LANCZOS))
+            data = Encoder.Timed(self, scaled, settings)
+
+        if len(data) > budget:
+            log.error(f"Failed to encode the Item Shop image within {budget:,} bytes")
+
+        return data
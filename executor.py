@@ -0,0 +1,158 @@
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool, resource_tracker
+
+log = logging.getLogger(__name__)
+
+BACKENDS = ("process", "thread", "serial")
+
+
+def available_cpus():
+    """Return the number of CPUs this process may use, including the CPU quota of its container."""
+
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    # A container quota is not reflected in the affinity of the process
+    try:
+        with open("/sys/fs/cgroup/cpu.max", "r") as file:
+            quota, period = file.read().split()
+
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    return cpus
+
+
+def available_memory():
+    """Return the number of bytes of memory available to this process, or None if unknown."""
+
+    available = None
+
+    try:
+        with open("/proc/meminfo", "r") as file:
+            for line in file:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+
+                    break
+    except (OSError, ValueError):
+        pass
+
+    # A container limit is not reflected in the memory of the host
+    try:
+        with open("/sys/fs/cgroup/memory.max", "r") as file:
+            limit = file.read().strip()
+        with open("/sys/fs/cgroup/memory.current", "r") as file:
+            current = int(file.read().strip())
+
+        if limit != "max":
+            remaining = int(limit) - current
+            available = remaining if available is None else min(available, remaining)
+    except (OSError, ValueError):
+        pass
+
+    return available
+
+
+def default_workers(items: int = None, memoryPerWorker: int = None):
+    """
+    Return the number of workers to use, one per available CPU capped by the
+    number of items and by the number of workers which fit in memory.
+    """
+
+    workers = available_cpus()
+
+    if items is not None:
+        workers = min(workers, items)
+
+    if memoryPerWorker is not None:
+        memory = available_memory()
+
+        if memory is not None:
+            workers = min(workers, memory // memoryPerWorker)
+
+    return max(1, workers)
+
+
+class Executor:
+    """
+    Runs a function over many items, either on a pool of processes, a pool
+    of threads, or serially in the calling thread for debugging.
+
+    The initializer runs once in every worker process, or once in the calling
+    process for the thread and serial backends.
+    """
+
+    def __init__(self, backend: str, workers: int, initializer=None, initargs: tuple = ()):
+        if backend not in BACKENDS:
+            log.warning(f"Unsupported executor backend {backend}, defaulting to process")
+
+            backend = "process"
+
+        self.backend = backend
+        self.workers = workers
+        self.pool = None
+
+        if backend == "process":
+            # Workers inherit the resource tracker of this process rather than
+            # each starting their own, which would unlink or warn about shared
+            # memory this process created and already unlinked
+            resource_tracker.ensure_running()
+
+            self.pool = Pool(workers, initializer=initializer, initargs=initargs)
+        else:
+            if initializer is not None:
+                initializer(*initargs)
+
+            if backend == "thread":
+                self.pool = ThreadPoolExecutor(workers)
+
+        log.info(f"Started {backend} executor with {workers if backend != 'serial' else 1} workers")
+
+    def Map(self, function, items: list):
+        """Return the result of the function for each of the provided items, in order."""
+
+        if self.backend == "process":
+            return self.pool.map(function, items)
+        elif self.backend == "thread":
+            return list(self.pool.map(function, items))
+
+        return [function(item) for item in items]
+
+    def Close(self):
+        """Wait for the workers to finish and release them."""
+
+        if self.backend == "process":
+            self.pool.close()
+            self.pool.join()
+        elif self.backend == "thread":
+            self.pool.shutdown(wait=True)
+
+        self.pool = None
+
+    def Terminate(self):
+        """Stop the workers without waiting for pending work."""
+
+        if self.backend == "process":
+            self.pool.terminate()
+            self.pool.join()
+        elif self.backend == "thread":
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        if kind is None:
+            Executor.Close(self)
+        else:
+            Executor.Terminate(self)
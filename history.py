@@ -0,0 +1,136 @@
+import logging
+import os
+import sqlite3
+from datetime import date
+
+from records import ITEM_TYPES, Records
+
+log = logging.getLogger(__name__)
+
+
+class ShopHistory:
+    """
+    Local index of the appearances of every item in the Item Shop.
+
+    Only a summary of each item is kept, its number of visits, its last two
+    appearances and its streak of consecutive days, updated once per day from
+    that day's Item Shop. Items missing from the index are seeded from their
+    shopHistory, after which the API can leave shop histories out entirely.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summary (
+                id TEXT PRIMARY KEY,
+                visits INTEGER NOT NULL,
+                last TEXT NOT NULL,
+                previous TEXT,
+                streak INTEGER NOT NULL
+            )
+            """
+        )
+        self.connection.commit()
+
+    def Key(self, item: dict):
+        """Return the key of the provided Item Shop entry, the id of its first item or its offer id."""
+
+        for key in ITEM_TYPES:
+            if key in item and item[key]:
+                return item[key][0].get("id") or item.get("offerId")
+
+        return item.get("offerId")
+
+    def Seed(self, item: dict):
+        """
+        Return the summary of the provided Item Shop entry built from its
+        shopHistory, or None if it has none.
+        """
+
+        shopHistory = None
+        for key in ITEM_TYPES:
+            if key in item and item[key] is not None:
+                shopHistory = item[key][0].get("shopHistory")
+
+                break
+
+        if not shopHistory:
+            return
+
+        appearances, daysSince, streak = Records.History(self, item)
+        last = date.fromisoformat(shopHistory[-1][:10])
+        previous = None if daysSince is None else date.fromordinal(last.toordinal() - daysSince)
+
+        return appearances, last.isoformat(), None if previous is None else previous.isoformat(), streak
+
+    def Update(self, day: str, items: list):
+        """
+        Record the appearance of each of the provided Item Shop entries on the
+        provided ISO8601 day, recording the same day again changes nothing.
+
+        Return the (appearances, daysSince, streak) of each entry, in order.
+        """
+
+        keys = [ShopHistory.Key(self, item) for item in items]
+        unique = list(dict.fromkeys(key for key in keys if key is not None))
+        rows = {}
+
+        # Stay below the limit of variables in a single statement
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            rows.update(
+                (row[0], row[1:])
+                for row in self.connection.execute(
+                    f"SELECT id, visits, last, previous, streak FROM summary WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+            )
+
+        changed = {}
+        for key, item in zip(keys, items):
+            if key is None or key in changed:
+                continue
+
+            summary = rows.get(key) or ShopHistory.Seed(self, item)
+
+            if summary is None:
+                summary = (1, day, None, 1)
+            elif summary[1] < day:
+                visits, last, previous, streak = summary
+                gap = (date.fromisoformat(day) - date.fromisoformat(last)).days
+                summary = (visits + 1, day, last, streak + 1 if gap == 1 else 1)
+
+            if rows.get(key) != summary:
+                changed[key] = summary
+            rows[key] = summary
+
+        if len(changed) > 0:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO summary (id, visits, last, previous, streak) VALUES (?, ?, ?, ?, ?)",
+                    [(key, *summary) for key, summary in changed.items()],
+                )
+
+            log.info(f"Updated the shop history of {len(changed)} items")
+
+        results = []
+        for key in keys:
+            if key is None:
+                results.append(None)
+
+                continue
+
+            visits, last, previous, streak = rows[key]
+            daysSince = None
+            if previous is not None:
+                daysSince = (date.fromisoformat(last) - date.fromisoformat(previous)).days
+
+            results.append((visits, daysSince, streak))
+
+        return results
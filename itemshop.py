@@ -1,19 +1,29 @@
+import argparse
+import hashlib
+import io
 import json
 import logging
 import math
-import discord
-import praw
-from discord.ext import commands
-from math import ceil
-from sys import exit
-from time import sleep
-from datetime import datetime, timezone
-from multiprocessing import Pool
+import os
+import signal
+from sys import exit, version_info
+from time import perf_counter, sleep
+from datetime import datetime, timedelta, timezone
+from multiprocessing import shared_memory
 from functools import partial
 
 import coloredlogs
 from PIL import Image, ImageDraw, ImageColor, ImageFilter, ImageChops
 
+from assets import AssetUtil
+from cache import DiskCache
+from encoder import EncodedImage, Encoder
+from executor import Executor, default_workers
+from history import ShopHistory
+from layout import Layout
+from metrics import Metrics
+from publishers import create_publishers, publish_all
+from records import Record, Records
 from util import ImageUtil, Utility
 
 log = logging.getLogger(__name__)
@@ -22,6 +32,39 @@ coloredlogs.install(level="INFO", fmt="[%(asctime)s] %(message)s", datefmt="%I:%
 import warnings
 warnings.simplefilter(action='ignore', category=DeprecationWarning)
 
+# Bump whenever the static layer drawn by GenerateCard changes, invalidating cached cards
+CARD_VERSION = 1
+
+# Render profiles, from the fastest to the highest quality. Every profile
+# draws the same layout, draft skips the fade behind the card text and the
+# borders of new and returning items, and only final optimizes the output.
+PROFILES = {
+    "draft": {
+        "resample": Image.BILINEAR,
+        "reducingGap": 1.0,
+        "fade": False,
+        "borders": False,
+        "output": {"optimize": False, "compressLevel": 1},
+    },
+    "standard": {
+        "resample": Image.LANCZOS,
+        "reducingGap": 3.0,
+        "fade": True,
+        "borders": True,
+        "output": {"optimize": False},
+    },
+    "final": {
+        "resample": Image.LANCZOS,
+        "reducingGap": 3.0,
+        "fade": True,
+        "borders": True,
+        "output": {},
+    },
+}
+
+# Shared memory Item Shop images the current process is attached to, see Athena.RenderCardInto
+_shared = {}
+
 class Athena:
     """Fortnite Item Shop Generator."""
 
@@ -35,79 +78,175 @@ class Athena:
                 log.info(f"Delaying process start for {self.delay}s...")
                 sleep(self.delay)
 
-            itemShop = Utility.GET(
-                self,
-                "https://fortnite-api.com/v2/shop",
-                {"language": self.language},
-                {"responseFlags": 5},
+            shops = Athena.FetchShops(self)
+
+            if shops is not None:
+                Athena.Post(self, shops)
+
+            self.metrics.Write(self.metricsReport, self.metricsPrometheus)
+
+    def Daemon(self):
+        """
+        Keep running, polling the Item Shop every interval and only generating
+        and posting a new image when its entries have changed.
+
+        The card rendering pool along with the fonts, assets and caches of
+        every process stay loaded between posts.
+        """
+
+        print("Fortnite Item Shop Generator (daemon)")
+
+        initialized = Athena.LoadConfiguration(self)
+
+        if initialized is not True:
+            return
+
+        # Workers inherit the configuration loaded above
+        self.pool = Executor(
+            self.executorBackend,
+            self.workers or default_workers(None, self.memoryPerWorker),
+            Athena.Worker if self.executorBackend == "process" else AssetUtil.Preload,
+            (self,),
+        )
+        previous = Athena.ReadState(self)
+
+        log.info(f"Polling the Item Shop every {self.interval}s...")
+
+        try:
+            while True:
+                self.metrics = Metrics()
+
+                try:
+                    shops = Athena.FetchShops(self)
+
+                    if shops is not None:
+                        # Every language rotates along with the first one
+                        digest = Athena.ShopDigest(self, shops[self.languages[0]])
+
+                        if digest != previous:
+                            log.info("Item Shop changed, generating image...")
+
+                            # A failed image is retried on the next poll
+                            if Athena.Post(self, shops) is True:
+                                previous = digest
+                                Athena.WriteState(self, digest)
+
+                            self.metrics.Write(self.metricsReport, self.metricsPrometheus)
+                except Exception as e:
+                    log.critical(f"Failed to update the Item Shop, {e}")
+
+                # The Item Shop rotates at 00:00 UTC, poll right as it does
+                now = datetime.now(timezone.utc)
+                rotation = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+                sleep(max(1, min(self.interval, (rotation - now).total_seconds())))
+        finally:
+            self.pool.Terminate()
+            self.pool = None
+
+    def Worker(self):
+        """
+        Initializer of the resident card rendering pool, interrupts are left to
+        the daemon so that it can shut the pool down.
+        """
+
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        AssetUtil.Preload(self)
+
+    def ShopDigest(self, itemShop: dict):
+        """Return a digest of the entries of the provided Item Shop, which changes with every rotation or update."""
+
+        return hashlib.sha256(
+            json.dumps(itemShop["entries"], sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+    def ReadState(self):
+        """Return the digest of the last posted Item Shop, or None if nothing has been posted yet."""
+
+        try:
+            with open(self.statePath, "r", encoding="utf-8") as file:
+                return json.load(file).get("digest")
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            log.warning(f"Failed to read {self.statePath}, {e}")
+
+    def WriteState(self, digest: str):
+        """Save the digest of the last posted Item Shop, so a restart does not post it again."""
+
+        try:
+            with open(self.statePath, "w", encoding="utf-8") as file:
+                json.dump({"digest": digest, "posted": Utility.nowISO(self)}, file)
+        except Exception as e:
+            log.error(f"Failed to write {self.statePath}, {e}")
+
+    def Post(self, shops: dict):
+        """
+        Generate the image of each of the provided dictionary of language to
+        Item Shop and post it to every enabled platform of its language.
+
+        Return True if the image of the first language was sucessfully
+        generated, the other languages are not worth posting it again for.
+        """
+
+        dates = {}
+        for language, itemShop in shops.items():
+            # Strip time from the timestamp, we only need the date
+            date = Utility.ISOtoHuman(
+                self, itemShop["date"].split("T")[0], language
             )
+            dates[language] = (date, itemShop)
+        log.info(f"Retrieved Item Shop for {dates[self.languages[0]][0]}")
+
+        shopImages = Athena.GenerateImages(self, dates)
+
+        with self.metrics.Span("publish"):
+            for language, shopImage in shopImages.items():
+                # Publishers without a language post the first one
+                publishers = [
+                    publisher
+                    for publisher in self.publishers
+                    if (publisher.language or self.languages[0]) == language
+                ]
+
+                publish_all(publishers, shopImage, self.metrics)
+
+        return self.languages[0] in shopImages
+
+    def FetchShops(self):
+        """
+        Return a dictionary of language to the current Item Shop data of every
+        configured language, or None if the first language could not be
+        retrieved.
+        """
+
+        shops = {}
+
+        for language in self.languages:
+            itemShop = Athena.FetchShop(self, language)
 
             if itemShop is not None:
-                itemShop = json.loads(itemShop)["data"]
+                shops[language] = itemShop
+            elif language == self.languages[0]:
+                return
 
-                # Strip time from the timestamp, we only need the date
-                date = Utility.ISOtoHuman(
-                    self, itemShop["date"].split("T")[0], self.language
-                )
-                log.info(f"Retrieved Item Shop for {date}")
-
-                shopImage = Athena.GenerateImage(self, date, itemShop)
-                intents = discord.Intents.default()  # Use default intents
-                intents.message_content = True       # Enable the MESSAGE_CONTENT intent (if you need to read message content)
-                intents.messages = True              # Enable the MESSAGES intent (if you need to receive message events)
-
-                bot = commands.Bot(command_prefix='!', intents=intents)
-
-                TOKEN = self.token # should be a string, with quotes
-                CHANNEL_ID = self.channel # should be an integer, no quotes
-
-                @bot.event
-                async def on_ready():
-                    print(f'Logged in as {bot.user.name} ({bot.user.id})')
-                    channel = bot.get_channel(CHANNEL_ID)
-                    if channel:
-                        current_date = datetime.utcnow().strftime('%B %d, %Y')
-                        with open('itemshop.png', 'rb') as img:
-                            await channel.send(f"Daily Item Shop {current_date}:", file=discord.File(img, 'itemshop.png'))
-                            await bot.close()
-
-                @bot.command()
-                async def upload(ctx):
-                    current_date = datetime.utcnow().strftime('%B %d, %Y')
-                    with open('itemshop.png', 'rb') as img:
-                        await ctx.send(f"Daily Item Shop {current_date}:", file=discord.File(img, 'itemshop.png'))
-                        await bot.close()
-
-                reddit = praw.Reddit(
-                    client_id=self.client_id,
-                    client_secret=self.client_secret,
-                    user_agent=self.user_agent,
-                    username=self.username,
-                    password=self.password
-                )
+        return shops
 
-                print(reddit.read_only)
-                # Output: False
-                
-                formatted_date = datetime.utcnow().strftime('%Y-%m-%d')
-                self.title = f"Daily Item Shop and Purchase Advice Megathread ({formatted_date})"
-                self.image_path = "itemshop.png"
-
-                if self.discordon is True:
-                    bot.run(TOKEN)
-
-                if self.redditon is True:
-                    reddit.subreddit(self.sub_reddit).submit_image(title=self.title, image_path=self.image_path, flair_id=self.flair_id)
-
-    def create_border_layer(card_size, border_size=10, radius=0, fillcolor='yellow'):
-        width, height = card_size
-        border_layer = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(border_layer)
-        draw.rounded_rectangle([0, 0, width, height], radius, fill=fillcolor)
-        inner_rect = [border_size, border_size, width - border_size, height - border_size]
-        draw.rounded_rectangle(inner_rect, radius - border_size, fill=(0, 0, 0, 0))
-        
-        return border_layer
+    def FetchShop(self, language: str = None):
+        """Return the current Item Shop data, or None if it could not be retrieved."""
+
+        with self.metrics.Span("fetch"):
+            itemShop = Utility.GET(
+                self,
+                f"{self.api}/v2/shop",
+                {"language": language or self.language},
+                # Shop histories make up most of the response
+                {"responseFlags": 5 if self.requestHistory is True else 1},
+            )
+
+        if itemShop is not None:
+            with self.metrics.Span("parse"):
+                return json.loads(itemShop)["data"]
 
     def LoadConfiguration(self):
         """
@@ -118,20 +257,86 @@ class Athena:
 
         configuration = json.loads(Utility.ReadFile(self, "configuration", "json"))
 
+        return Athena.ApplyConfiguration(self, configuration)
+
+    def ApplyConfiguration(self, configuration: dict):
+        """
+        Set the configuration values specified in the provided configuration.
+
+        Return True if configuration sucessfully loaded.
+        """
+
         try:
+            self.api = configuration.get("api", "https://fortnite-api.com")
+            self.requestTimeout = configuration.get("requestTimeout", 30)
             self.delay = configuration["delayStart"]
             self.language = configuration["language"]
-            self.discordon = configuration["discord"]["enabled"]
-            self.token = configuration["discord"]["TOKEN"]
-            self.channel = configuration["discord"]["CHANNEL_ID"]
-            self.redditon = configuration["reddit"]["enabled"]
-            self.client_id = configuration["reddit"]["client_id"]
-            self.client_secret = configuration["reddit"]["client_secret"]
-            self.user_agent = configuration["reddit"]["user_agent"]
-            self.username = configuration["reddit"]["username"]
-            self.password = configuration["reddit"]["password"]
-            self.sub_reddit = configuration["reddit"]["sub_reddit"]
-            self.flair_id = configuration["reddit"]["flair_id"]
+            self.languages = configuration.get("languages") or [self.language]
+            self.language = self.languages[0]
+            self.publishers = create_publishers(configuration)
+
+            cache = configuration.get("cache", {})
+            if cache.get("enabled", False) is True:
+                self.cache = DiskCache(
+                    cache.get("directory", "cache/"),
+                    cache.get("maxSizeMB", 512) * 1024 * 1024,
+                )
+            else:
+                self.cache = None
+
+            history = configuration.get("history", {})
+            if history.get("enabled", False) is True:
+                self.history = ShopHistory(history.get("path", "history.db"))
+            else:
+                self.history = None
+            self.requestHistory = history.get("request", True)
+
+            render = configuration.get("render", {})
+            self.maxWidth = render.get("maxWidth", 7500)
+            self.profileName = render.get("profile", "final")
+            if self.profileName not in PROFILES:
+                log.warning(f"Unsupported render profile {self.profileName}, defaulting to final")
+
+                self.profileName = "final"
+            self.profile = PROFILES[self.profileName]
+            self.resample = self.profile["resample"]
+            self.renderScale = render.get("scale", 1)
+            self.directRender = render.get("direct", False)
+            self.sharedCanvas = render.get("sharedCanvas", False)
+
+            self.output = Encoder.Settings(
+                self, {**configuration.get("output", {}), **self.profile["output"]}
+            )
+            self.outputPath = configuration.get("output", {}).get("path", "itemshop.{extension}")
+
+            # Variants are encoded with the output settings, overridden by their own
+            self.variants = {
+                name: (
+                    variant.get("maxWidth", 7500),
+                    Encoder.Settings(
+                        self, {**configuration.get("output", {}), **variant, **self.profile["output"]}
+                    ),
+                )
+                for name, variant in configuration.get("output", {}).get("variants", {}).items()
+            }
+
+            executor = configuration.get("executor", {})
+            self.executorBackend = executor.get("backend", "process")
+            self.workers = executor.get("workers")
+            self.memoryPerWorker = executor.get("memoryPerWorkerMB", 256) * 1024 * 1024
+
+            prefetch = configuration.get("prefetch", {})
+            self.prefetchWorkers = prefetch.get("workers", 16)
+            self.prefetchPerHost = prefetch.get("perHost", 8)
+
+            metrics = configuration.get("metrics", {})
+            self.metricsReport = metrics.get("report")
+            self.metricsPrometheus = metrics.get("prometheus")
+            self.metrics = Metrics()
+
+            daemon = configuration.get("daemon", {})
+            self.interval = daemon.get("interval", 60)
+            self.statePath = daemon.get("state", "daemon.json")
 
             log.info("Loaded configuration")
 
@@ -139,11 +344,152 @@ class Athena:
         except Exception as e:
             log.critical(f"Failed to load configuration, {e}")
 
-    def GenerateImage(self, date: str, itemShop: dict):
+    def GenerateImage(self, date: str, itemShop: dict, keepImage: bool = False):
         """
-        Generate the Item Shop image using the provided Item Shop.
+        Generate the Item Shop image using the provided Item Shop, and save
+        it to the output path if one is set.
 
-        Return True if image sucessfully saved.
+        Return the encoded image, along with the image itself if keepImage is
+        set, or None if it could not be generated.
+        """
+
+        return Athena.GenerateImages(self, {None: (date, itemShop)}, keepImage).get(None)
+
+    def GenerateImages(self, shops: dict, keepImage: bool = False):
+        """
+        Generate the Item Shop image of every language using the provided
+        dictionary of language to (date, Item Shop), and save each to the
+        output path if one is set.
+
+        Icons are downloaded once for every language, and each card only has
+        its text drawn once per language on top of a single shared layer.
+
+        Return a dictionary of language to encoded image, along with the image
+        itself if keepImage is set, for every image which was generated.
+        """
+
+        prepared = {}
+        for language, (date, itemShop) in shops.items():
+            shop = Athena.PrepareImage(self, date, itemShop)
+
+            if shop is not None:
+                prepared[language] = shop
+
+        if len(prepared) == 0:
+            return {}
+
+        # Icons are revalidated even when their card is cached, as the card key
+        # depends on their content rather than their url
+        candidates = []
+        labels = []
+        for shop in prepared.values():
+            for record in shop["records"]:
+                candidates.append([] if record is None else record.icons)
+                labels.append({"offerId": None if record is None else record.offerId})
+
+        # Every url is only downloaded once, regardless of the number of languages
+        with self.metrics.Span("prefetch"):
+            icons = iter(ImageUtil.Prefetch(self, candidates, labels))
+        for shop in prepared.values():
+            records = shop["records"]
+            for i, (record, placement) in enumerate(zip(records, shop["target"].cards)):
+                icon = next(icons)
+                if record is not None:
+                    record = record._replace(
+                        iconData=icon,
+                        iconDigest=None if icon is None else hashlib.sha256(icon).hexdigest(),
+                        targetSize=(placement.width, placement.height) if shop["scale"] != 1 else None,
+                    )
+
+                    # Cards with a cached static layer do not need their icon
+                    if self.cache is not None and icon is not None and self.cache.Contains(Athena.CardKey(self, record)):
+                        record = record._replace(iconData=None)
+
+                    records[i] = record
+
+        shared = None
+        with self.metrics.Span("render"):
+            # Threads and serial rendering already share the image of this process
+            if self.sharedCanvas is True and self.executorBackend == "process" and len(prepared) == 1:
+                shop = next(iter(prepared.values()))
+                shopImage = shop["image"]
+
+                # Workers composite their card straight onto the image rather than returning it
+                pixels = shopImage.tobytes()
+                shared = shared_memory.SharedMemory(create=True, size=len(pixels))
+                shared.buf[:len(pixels)] = pixels
+                del pixels
+
+                generate_card = partial(Athena.RenderCardInto, self, (shared.name, shopImage.width))
+                tasks = list(zip(shop["records"], shop["target"].cards))
+            else:
+                # The same offer in every language is rendered by a single worker
+                groups = {}
+                for language, shop in prepared.items():
+                    for i, record in enumerate(shop["records"]):
+                        key = (None, language, i) if record is None else record.offerId
+                        groups.setdefault(key, []).append((language, i))
+
+                generate_card = partial(Athena.RenderCards,self)
+                tasks = [
+                    [prepared[language]["records"][i] for language, i in group]
+                    for group in groups.values()
+                ]
+
+            try:
+                # The daemon keeps its pool warm, a single run starts its own
+                if getattr(self, "pool", None) is not None:
+                    rendered = self.pool.Map(generate_card, tasks)
+                else:
+                    workers = self.workers or default_workers(len(tasks), self.memoryPerWorker)
+                    with Executor(
+                        self.executorBackend, min(workers, len(tasks)), AssetUtil.Preload, (self,)
+                    ) as executor:
+                        rendered = executor.Map(generate_card, tasks)
+
+                if shared is not None:
+                    with shared.buf[:shopImage.width * shopImage.height * 3] as pixels:
+                        shop["image"] = Image.frombytes("RGB", shopImage.size, pixels)
+            finally:
+                if shared is not None:
+                    shared.close()
+                    shared.unlink()
+
+        # Spans recorded by the workers are merged into the report of this run
+        for shop in prepared.values():
+            shop["cards"] = [None] * len(shop["records"])
+        if shared is not None:
+            shop = next(iter(prepared.values()))
+            for i, (card, spans) in enumerate(rendered):
+                shop["cards"][i] = card
+                self.metrics.Merge(spans)
+        else:
+            for group, results in zip(groups.values(), rendered):
+                for (language, i), (card, spans) in zip(group, results):
+                    prepared[language]["cards"][i] = card
+                    self.metrics.Merge(spans)
+
+        results = {}
+        for language, shop in prepared.items():
+            result = Athena.ComposeImage(self, shop, language if len(prepared) > 1 else None, keepImage)
+
+            if result is not None:
+                results[language] = result
+
+        cards = [card for shop in prepared.values() for card in shop["cards"]]
+        self.metrics.Set("cards", len(cards))
+        self.metrics.Set("cards_failed", cards.count(None))
+        self.metrics.Set("output_bytes", sum(len(result.data) for result in results.values()))
+
+        if self.cache is not None:
+            self.cache.Prune()
+
+        return results
+
+    def PrepareImage(self, date: str, itemShop: dict):
+        """
+        Return the layout, background and normalized records of the Item Shop
+        image of the provided Item Shop, or None if it has no items.
         """
 
         try:
@@ -151,11 +497,11 @@ class Athena:
                 
             if not raw_items:
                 log.warning("No items in the item shop")
-                return False
+                return
 
         except Exception as e:
             log.critical(f"Failed to parse Item Shop items, {e}, {raw_items}")
-            return False
+            return
 
         all_items = [
             item for item in raw_items 
@@ -185,390 +531,375 @@ class Athena:
         all_items.sort(key=lambda x: x["layout"]["name"])
         all_items.sort(key=lambda x: (x["gridCategory"]))
 
-        num_items = 0
-        for item in all_items:
-            item["gridSize"] = int(item['tileSize'].split('_')[1])
-            num_items = num_items + item["gridSize"]
-        rows_raw = math.ceil(num_items / 4)
-        columns_raw = math.ceil(math.sqrt(rows_raw)) * 2
-        if num_items <= 6:
-            columns = columns_raw
-        elif num_items <= 8:
-            columns = columns_raw + 1
-        else:
-            columns = columns_raw + 5
-        if (columns % 4) > 0:
-            columns += 4 - (columns % 4)
-        if columns < 4:
-            columns = 4
-        rows = math.ceil(num_items / columns) + 1
-        block_width = 4
-        gap_size = 250
-        rowsabove = 1
-        rowcount = 1
-        metacolumn = 1
-        position = 0
-        metaposition = 0
-
-        previous_layout = None
-        block_x_offset = 0
-        block_y_offset = 0
-        current_position = 0
-        block_y_offset_alt = 0
-        rowsabove_alt = 0
-        previous_offset = 0
-        x_vals = []
-        y_vals = []
-
-        for i in all_items:
-            current_layout = i["layout"]["name"]
-            grid_size = i["gridSize"]
-            metaposition += grid_size
-            card_width = 340 * grid_size
-            card_height = 545
-            rowcount = ceil(metaposition / block_width)
-            if current_layout != previous_layout:
-                adjust = (metaposition - grid_size) % 4
-                if adjust > 0:
-                    metaposition += 4 - adjust
-                rowcount = ceil(metaposition / block_width)
-            if rowcount > rows:
-                metacolumn += 1
-                block_x_offset += (340 * 4) + gap_size
-                metaposition = grid_size
-                rowsabove_alt = 1
-                block_y_offset_alt = card_height + gap_size
-                rowcount = ceil(metaposition / block_width)
-                current_position = 0
-            if current_layout != previous_layout:
-                current_position = 0
-                rowsabove = 1
-                block_y_offset += (card_height * rowsabove) + gap_size + previous_offset
-                if block_y_offset_alt > 0:
-                    block_y_offset = (card_height * rowsabove) + gap_size
-                    block_y_offset_alt = 0
-                position = grid_size
-                previous_layout = current_layout
-                layalt = 1
-            else:
-                position += grid_size
-                rowsabove = ceil(position / block_width)
-                if block_y_offset_alt > 0:
-                    rowsabove = 1
-                    block_y_offset = (card_height * rowsabove) + gap_size
-                    block_y_offset_alt = 0
-                    current_position = 0
-            if ((grid_size == 4) and ((current_position + grid_size) % block_width) > 0) or ((grid_size >= 3) and ((current_position % 4) >= 2)) or ((grid_size >= 2) and ((current_position % 4) >= 3)):
-                adjust = (4 - (current_position % block_width))
-                current_position += adjust
-                position += adjust
-                metaposition += adjust
-                rowcount = ceil(metaposition / block_width)
-            x_position = block_x_offset + (current_position % block_width) * (card_width // grid_size + 5) + 230
-            y_position = block_y_offset + ((current_position // block_width) * (card_height + 5))
-            previous_offset = y_position - block_y_offset
-            x_vals.append(x_position + card_width)
-            y_vals.append(y_position + card_height)
-            current_position += grid_size
-
-        width = max(x_vals) + 230
-        height = max(y_vals) + 100
-        shopImage = Image.new("RGBA", (width, height))
-        try:
-            background = ImageUtil.Open(self, "background.png")
-            background = ImageUtil.RatioResize(
-                self, background, shopImage.width, shopImage.height
+        with self.metrics.Span("layout"):
+            num_items = 0
+            for item in all_items:
+                item["gridSize"] = int(item['tileSize'].split('_')[1])
+                num_items = num_items + item["gridSize"]
+
+            plan = Layout.Plan(
+                self, [(item["layout"]["name"], item["gridSize"]) for item in all_items]
             )
-            shopImage.paste(
-                background, ImageUtil.CenterX(self, background.width, shopImage.width)
+            columns, width = plan.columns, plan.width
+
+            # Compose at the output size rather than resampling the full image afterwards
+            scale = self.renderScale
+            if self.directRender is True and width * scale > self.maxWidth:
+                scale = self.maxWidth / width
+            target = Layout.Scale(self, plan, scale)
+
+        with self.metrics.Span("compose"):
+            shopImage = Image.new("RGB", (target.width, target.height))
+            try:
+                background = ImageUtil.Open(self, "background.png")
+                background = ImageUtil.RatioResize(
+                    self, background, shopImage.width, shopImage.height
+                )
+                shopImage.paste(
+                    background, ImageUtil.CenterX(self, background.width, shopImage.width)
+                )
+            except FileNotFoundError:
+                log.warn("Failed to open background.png, defaulting to dark gray")
+                shopImage.paste((18, 18, 18), [0, 0, shopImage.size[0], shopImage.size[1]])
+            datesize, codesize, subfontsize, title_top, date_top, push = Layout.TitleSizes(self, columns)
+            datesize, codesize, subfontsize = (
+                max(1, round(size * scale)) for size in (datesize, codesize, subfontsize)
+            )
+            title_top, date_top, push = (
+                math.floor(distance * scale) for distance in (title_top, date_top, push)
+            )
+
+            canvas = ImageDraw.Draw(shopImage)
+            font = ImageUtil.Font(self, datesize)
+            textWidth = ImageUtil.TextWidth(self, font, date)
+            canvas.text(
+                ImageUtil.CenterX(self, textWidth, (textWidth + push), date_top),
+                date,
+                (255, 255, 255),
+                font=font,
+            )
+            below_code="Use our code! #EpicPartner"
+            textWidth = ImageUtil.TextWidth(self, font, below_code)
+            canvas.text(
+                ImageUtil.CenterX(self, textWidth, (shopImage.width * 2 - (textWidth + push)), date_top),
+                "Use our code! #EpicPartner",
+                (255, 255, 255),
+                font=font,
+            )
+            creator_code="FNFASHION"
+            code_font = ImageUtil.TitleFont(self, codesize)
+            textWidth = ImageUtil.TextWidth(self, code_font, creator_code)
+            canvas.text(
+                ImageUtil.CenterX(self, textWidth, (shopImage.width * 2 - (textWidth + push)), title_top),
+                creator_code,
+                (255, 255, 255),
+                font=code_font,
+            )
+            subreddit_name="r/FortniteFashion"
+            sub_font = ImageUtil.TitleFont(self, subfontsize)
+            textWidth = ImageUtil.TextWidth(self, code_font, subreddit_name)
+            canvas.text(
+                ImageUtil.CenterX(self, textWidth, (textWidth + push), title_top),
+                subreddit_name,
+                (255, 255, 255),
+                font=sub_font,
             )
-        except FileNotFoundError:
-            log.warn("Failed to open background.png, defaulting to dark gray")
-            shopImage.paste((18, 18, 18), [0, 0, shopImage.size[0], shopImage.size[1]])
-        def calculate_sizes(columns):
-            ranges = {
-                (1, 4): (16, 26, 26, 380, 540, 150),
-                (5, 8): (14, 24, 24, 160, 440, 200),
-                (9, 12): (12, 21, 21, 70, 410, 200),
-                (13, 16): (10, 17, 17, 70, 430, 200),
-                (17, 23): (7, 13, 13, 70, 430, 200),
-                (24, 27): (6, 11, 11, 80, 430, 200),
-                (28, 31): (5, 9, 9, 90, 430, 200),
-                (32, 35): (4, 8, 8, 120, 460, 200),
-                (36, float('inf')): (4, 8, 8, 100, 460, 200)
-            }
 
-            for (start, end), values in ranges.items():
-                if start <= columns <= end:
-                    return values
+        # Workers only receive the fields needed to render each card
+        summaries = [None] * len(all_items)
+        if self.history is not None:
+            with self.metrics.Span("history"):
+                summaries = self.history.Update(itemShop["date"].split("T")[0], all_items)
+
+        with self.metrics.Span("normalize"):
+            records = [
+                Records.Normalize(self, item, summary) for item, summary in zip(all_items, summaries)
+            ]
+
+        return {
+            "image": shopImage,
+            "records": records,
+            "plan": plan,
+            "target": target,
+            "scale": scale,
+        }
+
+    def ComposeImage(self, shop: dict, language: str, keepImage: bool):
+        """
+        Draw the section headers and paste the rendered cards of the provided
+        prepared Item Shop image, then encode it and save it to the output
+        path if one is set.
 
-        datesize, codesize, subfontsize, title_top, date_top, push = calculate_sizes(columns)
-        datesize = datesize * columns
-        codesize = codesize * columns
-        subfontsize = subfontsize * columns
+        Return the encoded image, or None if it could not be saved.
+        """
 
+        shopImage = shop["image"]
+        plan, target, scale = shop["plan"], shop["target"], shop["scale"]
         canvas = ImageDraw.Draw(shopImage)
-        font = ImageUtil.Font(self, datesize)
-        textWidth, _ = font.getsize(date)
-        canvas.text(
-            ImageUtil.CenterX(self, textWidth, (textWidth + push), date_top),
-            date,
-            (255, 255, 255),
-            font=font,
-        )
-        below_code="Use our code! #EpicPartner"
-        textWidth, _ = font.getsize(below_code)
-        canvas.text(
-            ImageUtil.CenterX(self, textWidth, (shopImage.width * 2 - (textWidth + push)), date_top),
-            "Use our code! #EpicPartner",
-            (255, 255, 255),
-            font=font,
-        )
-        creator_code="FNFASHION"
-        code_font = ImageUtil.TitleFont(self, codesize)
-        textWidth, _ = code_font.getsize(creator_code)
-        canvas.text(
-            ImageUtil.CenterX(self, textWidth, (shopImage.width * 2 - (textWidth + push)), title_top),
-            creator_code,
-            (255, 255, 255),
-            font=code_font,
-        )
-        subreddit_name="r/FortniteFashion"
-        sub_font = ImageUtil.TitleFont(self, subfontsize)
-        textWidth, _ = code_font.getsize(subreddit_name)
-        canvas.text(
-            ImageUtil.CenterX(self, textWidth, (textWidth + push), title_top),
-            subreddit_name,
-            (255, 255, 255),
-            font=sub_font,
-        )
 
-        pool = Pool(16)
-        generate_card = partial(Athena.GenerateCard,self)
-        cards = pool.map(generate_card, all_items)
-        cards = [c for c in cards if c is not None]
-
-        block_width = 4
-        gap_size = 250
-        rowsabove = 1
-        rowcount = 1
-        metacolumn = 1
-        position = 0
-        metaposition = 0
-
-        previous_layout = None
-        block_x_offset = 0
-        block_y_offset = 0
-        current_position = 0
-        block_y_offset_alt = 0
-        rowsabove_alt = 0
-        previous_offset = 0
-
-        for i, card in enumerate(cards):
-            current_layout = all_items[i]["layout"]["name"]
-            grid_size = all_items[i]["gridSize"]
-            metaposition += grid_size
-            rowcount = ceil(metaposition / block_width)
-            if current_layout != previous_layout:
-                adjust = (metaposition - grid_size) % 4
-                if adjust > 0:
-                    metaposition += 4 - adjust
-                rowcount = ceil(metaposition / block_width)
-            if rowcount > rows:
-                metacolumn += 1
-                block_x_offset += (340 * 4) + gap_size
-                metaposition = grid_size
-                rowsabove_alt = 1
-                block_y_offset_alt = card.height + gap_size
-                rowcount = ceil(metaposition / block_width)
-                current_position = 0
-            if current_layout != previous_layout:
-                current_position = 0
-                rowsabove = 1
-                block_y_offset += (card.height * rowsabove) + gap_size + previous_offset
-                if block_y_offset_alt > 0:
-                    block_y_offset = (card.height * rowsabove) + gap_size
-                    block_y_offset_alt = 0
-                sub_font = ImageUtil.TitleFont(self, 80)
-                textWidth, _ = sub_font.getsize(current_layout)
-                textscale = 1
-                if metacolumn > 1:
-                    textscale = 2
+        with self.metrics.Span("compose"):
+            sub_font = ImageUtil.TitleFont(self, max(1, round(80 * scale)))
+            for header in target.headers:
+                textWidth = ImageUtil.TextWidth(self, sub_font, header.text)
                 canvas.text(
-                    ImageUtil.CenterX(self, textWidth, (textscale * block_x_offset) + textWidth + 450, block_y_offset - 130),
-                    current_layout,
+                    ImageUtil.CenterX(self, textWidth, header.x + textWidth, header.y),
+                    header.text,
                     (255, 255, 255),
                     font=sub_font,
                 )
-                position = grid_size
-                previous_layout = current_layout
-            else:
-                position += grid_size
-                rowsabove = ceil(position / block_width)
-                if block_y_offset_alt > 0:
-                    rowsabove = 1
-                    block_y_offset = (card.height * rowsabove) + gap_size
-                    block_y_offset_alt = 0
-                    current_position = 0
-
-            if ((grid_size == 4) and ((current_position + grid_size) % block_width) > 0) or ((grid_size >= 3) and ((current_position % 4) >= 2)) or ((grid_size >= 2) and ((current_position % 4) >= 3)):
-                adjust = (4 - (current_position % block_width))
-                current_position += adjust
-                position += adjust
-                metaposition += adjust
-                rowcount = ceil(metaposition / block_width)
-
-            x_position = block_x_offset + (current_position % block_width) * (card.width // grid_size + 5) + 230
-            y_position = block_y_offset + ((current_position // block_width) * (card.height + 5))
-            previous_offset = y_position - block_y_offset
-            #print(f"{current_layout} / Row: {rowcount} / Size: {grid_size} / Position: {position} (Current: {current_position}; Meta: {metaposition}) / Adjust: {adjust}")
-            shopImage.paste(
-                card,
-                (
-                    x_position,
-                    y_position,
-                ),
-                card,
-            )
-            
-            current_position += grid_size
+
+            for card, placement in zip(shop["cards"], target.cards):
+                # Cards which failed to render leave their slot empty, cards
+                # composited onto the shared image are already in place
+                if isinstance(card, Image.Image):
+                    shopImage.paste(card, (placement.x, placement.y), card)
 
         try:
-            shopImage = shopImage.convert("RGB")
             x, y = shopImage.size
-            if x > 7500:
-                scale = 7500 / x
-                shopImage = shopImage.resize((math.floor(x*scale),math.floor(y*scale)),Image.ANTIALIAS)
-            shopImage.save("itemshop.png", optimize=True)
-            log.info("Generated Item Shop image")
+            if x > self.maxWidth:
+                with self.metrics.Span("resize"):
+                    scale = self.maxWidth / x
+                    shopImage = shopImage.resize((math.floor(x*scale),math.floor(y*scale)),self.resample)
+            # Smaller variants are each scaled down from the next larger one
+            levels = {}
+            if len(self.variants) > 0:
+                with self.metrics.Span("resize"):
+                    levels = Encoder.Pyramid(
+                        self, shopImage, {name: width for name, (width, _) in self.variants.items()}
+                    )
 
-            return True
+            with self.metrics.Span("encode"):
+                encoded = Encoder.EncodeAll(
+                    self,
+                    [(shopImage, self.output)]
+                    + [(image, self.variants[name][1]) for name, image in levels.items()],
+                )
+
+            variants = {}
+            for (name, image), (data, extension) in zip(levels.items(), encoded[1:]):
+                variants[name] = EncodedImage(
+                    data,
+                    extension,
+                    Athena.OutputName(self, "itemshop.{extension}", extension, language, name),
+                    image if keepImage is True else None,
+                )
+
+            data, extension = encoded[0]
+            result = EncodedImage(
+                data,
+                extension,
+                Athena.OutputName(self, "itemshop.{extension}", extension, language),
+                shopImage if keepImage is True else None,
+                variants,
+            )
+            if self.outputPath is not None:
+                with self.metrics.Span("save"):
+                    for name, image in [(None, result), *variants.items()]:
+                        path = Athena.OutputName(self, self.outputPath, image.extension, language, name)
+                        with open(path, "wb") as file:
+                            file.write(image.data)
+            log.info("Generated Item Shop image" if language is None else f"Generated Item Shop image ({language})")
+
+            return result
         except Exception as e:
-            log.critical(f"Failed to save Item Shop image, {e}\nImage Info:\nrows: {rows} x columns: {columns}\nwidth: {width} x height: {height}\ncount: {num_items}")
+            log.critical(f"Failed to save Item Shop image, {e}\nImage Info:\nrows: {plan.rows} x columns: {plan.columns}\nwidth: {plan.width} x height: {plan.height}\ncount: {len(shop['records'])}")
 
-    def GenerateCard(self, item: dict):
-        """Return the card image for the provided Fortnite Item Shop item."""
+    def OutputName(self, pattern: str, extension: str, language: str = None, variant: str = None):
+        """
+        Return the provided path pattern with its placeholders replaced.
 
-        def title_case(text):
-            words = text.split()
-            formatted_words = []
-            for word in words:
-                formatted_word = word[0].upper() + word[1:].lower()
-                formatted_word = formatted_word.replace("'S", "'s")
-                formatted_words.append(formatted_word)
-            return ' '.join(formatted_words)
+        The language and variant are appended to the name when the pattern has
+        no placeholder for them.
+        """
 
-        try:
-            if "bundle" in item and item["bundle"] is not None:
-                name = title_case(item["bundle"]["name"])
-                icon = item["bundle"]["image"]
-                shop_time = "Bundle"
-                category = "bundle"
-                shop_time_flag = "bundle"
-                if "banner" in item and item["banner"]["value"] == "New!":
-                    shop_time = "New!"
-                    shop_time_flag = "new"
-                    total_appearances = 1
-            else:
-                if "brItems" in item:
-                    name = item["brItems"][0]["name"]
-                    category = item["brItems"][0]["type"]["value"]
-                elif "legoKits" in item:
-                    name = item["legoKits"][0]["name"]
-                    category = item["legoKits"][0]["type"]["value"]
-                elif "instruments" in item:
-                    name = item["instruments"][0]["name"]
-                    category = item["instruments"][0]["type"]["value"]
-                elif "cars" in item:
-                    name = item["cars"][0]["name"]
-                    category = item["cars"][0]["type"]["value"]
-                else:
-                    name = "Unknown"
-                    category = "Unknown"
-                try:
-                    icon = item["newDisplayAsset"]["renderImages"][0]["image"]
-                except Exception as e:
-                    try:
-                        icon = item["newDisplayAsset"]["materialInstances"][0]["images"]["OfferImage"]
-                    except Exception as e:
-                        log.warn(f"No offerimage or renderimage for {name}.")
-                        icon = "https://None"
-                shopHistory = None
-                if "tracks" in item and item["tracks"] is not None:
-                    shopHistory = item["tracks"][0]["shopHistory"]
-                elif "brItems" in item and item["brItems"] is not None:
-                    shopHistory = item["brItems"][0]["shopHistory"]
-                elif "legoKits" in item and item["legoKits"] is not None:
-                    shopHistory = item["legoKits"][0]["shopHistory"]
-                elif "instruments" in item and item["instruments"] is not None:
-                    shopHistory = item["instruments"][0]["shopHistory"]
-                elif "cars" in item and item["cars"] is not None:
-                    shopHistory = item["cars"][0]["shopHistory"]
-                if shopHistory is not None:
-                    shopHistory_dates = [datetime.fromisoformat(date_string) for date_string in shopHistory]
-                    total_appearances = len(shopHistory_dates)
-                    if total_appearances < 2:
-                        shop_time = "New!"
-                        shop_time_flag = "new"
-                    else:
-                        days_difference = (shopHistory_dates[-1] - shopHistory_dates[-2]).days
-                        if days_difference == 1:
-                            current_date = shopHistory_dates[-1]
-                            days_consecutive = 1
-                            for i in range(total_appearances - 2, -1, -1):
-                                if (current_date - shopHistory_dates[i]).days == 1:
-                                    days_consecutive += 1
-                                    current_date = shopHistory_dates[i]
-                                else:
-                                    break
-                            if days_consecutive > 1:
-                                shop_time = f"In for {days_consecutive} days"
-                                shop_time_flag = "consecutive"
-                            else:
-                                shop_time = "1 day ago"
-                                shop_time_flag = "since"
-                        else:
-                            shop_time = f"{days_difference} days ago"
-                            shop_time_flag = "since"
-            leaves_date = datetime.fromisoformat(item["outDate"].replace('Z', '+00:00'))
-            time_difference = leaves_date - datetime.now(timezone.utc)
-            leaves_text = f"{time_difference.days}d {time_difference.seconds // 3600}h"
+        path = pattern.format(extension=extension, language=language or "", variant=variant or "")
+        root, suffix = os.path.splitext(path)
 
-            if "brItems" in item:
-                try:
-                    rarity = item["brItems"][0]["rarity"]["value"]
-                except Exception as e:
-                    rarity = "common"
-                if rarity == "gaminglegends":
-                    rarity = "gaming"
-            elif "legoKits" in item:
-                rarity = "lego"
-            elif "instruments" in item:
-                rarity = "festival"
-            elif "cars" in item:
-                rarity = "racing"
-            else:
-                rarity = "common"
-            price = item["finalPrice"]
-        except Exception as e:
-            log.error(f"Failed to parse item {name} ({rarity}/{category}/{price}), {e}")
+        for placeholder, value in (("{language}", language), ("{variant}", variant)):
+            if value is not None and placeholder not in pattern:
+                root = f"{root}_{value}"
+
+        return f"{root}{suffix}"
+
+    def CardKey(self, record: Record):
+        """
+        Return the cache key of the static layer of the card for the provided
+        Item Shop record.
 
+        The key covers every record field drawn on the static layer, the
+        content of its icon and the versions of the assets used to draw it.
+        Return None if the icon of the record is not known yet, as a changed
+        icon could not be told apart.
+        """
+
+        icon = record.iconDigest
+        if icon is None and record.iconData is not None:
+            icon = hashlib.sha256(record.iconData).hexdigest()
+
+        if icon is None:
             return
 
-        if "colors" in item:
-            if "color2" in item["colors"]:
+        fields = {
+            "renderer": CARD_VERSION,
+            "profile": self.profileName,
+            "assets": AssetUtil.Version(self),
+            "name": record.name,
+            "category": record.category,
+            "rarity": record.rarity,
+            "gridSize": record.gridSize,
+            "bundle": record.bundle,
+            "colors": record.colors,
+            "price": record.price,
+            "icons": record.icons,
+            "icon": icon,
+        }
+
+        digest = hashlib.sha256(
+            json.dumps(fields, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        return f"card:{digest}"
+
+    def RenderCards(self, records: list):
+        """
+        Return the card image and spans of each of the provided Item Shop
+        records, which are the same offer in different languages.
+
+        The icon, gradients and masks of the offer are only rendered once,
+        each language only draws its own text.
+        """
+
+        bases = {}
+
+        return [Athena.RenderCard(self, record, bases) for record in records]
+
+    def RenderCard(self, record: Record, bases: dict = None):
+        """
+        Return the card image for the provided Item Shop record, along with
+        the spans of the time spent downloading, decoding and rendering it.
+
+        If a dictionary of bases is provided, the language-independent layer
+        of the card is reused from, or added to, it.
+        """
+
+        if record is None:
+            return None, []
+
+        metrics = Metrics()
+        start = perf_counter()
+        card = Athena.GenerateCard(self, record, metrics, bases)
+
+        # Rendering is whatever time was not spent downloading or decoding
+        elapsed = perf_counter() - start - sum(span["seconds"] for span in metrics.spans)
+        metrics.Add("card.render", elapsed, offerId=record.offerId)
+
+        return card, metrics.spans
+
+    def RenderCardInto(self, shared: tuple, task: tuple):
+        """
+        Render the card of the provided (record, placement) task and composite
+        it onto the Item Shop image in the shared memory of the provided
+        (name, width), each card only touches the rows of its own placement.
+
+        Return True if the card was composited, or None, along with its spans.
+        """
+
+        record, placement = task
+        card, spans = Athena.RenderCard(self, record)
+
+        if card is None:
+            return None, spans
+
+        name, width = shared
+        if name not in _shared:
+            # Images of previous runs of the daemon are no longer used
+            for previous in _shared.values():
+                previous.close()
+            _shared.clear()
+
+            # Only the process which created the image may unlink it, before
+            # 3.13 the resource tracker shared with that process already has it
+            if version_info >= (3, 13):
+                _shared[name] = shared_memory.SharedMemory(name=name, track=False)
+            else:
+                _shared[name] = shared_memory.SharedMemory(name=name)
+
+        metrics = Metrics()
+        with metrics.Span("card.composite", offerId=record.offerId):
+            buffer = _shared[name].buf
+            stride = width * 3
+            rowSize = card.width * 3
+            offsets = [
+                (placement.y + row) * stride + placement.x * 3 for row in range(card.height)
+            ]
+
+            region = Image.frombytes(
+                "RGB", card.size, b"".join(buffer[offset:offset + rowSize] for offset in offsets)
+            )
+            region.paste(card, (0, 0), card)
+            pixels = region.tobytes()
+
+            for row, offset in enumerate(offsets):
+                buffer[offset:offset + rowSize] = pixels[row * rowSize:(row + 1) * rowSize]
+
+        return True, spans + metrics.spans
+
+    def GenerateCard(self, record: Record, metrics: Metrics = None, bases: dict = None):
+        """
+        Return the card image for the provided Item Shop record.
+
+        If provided, the time spent downloading and decoding is recorded to metrics.
+        """
+
+        if metrics is None:
+            metrics = Metrics()
+        offerId = record.offerId
+
+        name = record.name
+        category = record.category
+        rarity = record.rarity
+        price = record.price
+
+        if record.bundle is True:
+            shop_time = "Bundle"
+            shop_time_flag = "bundle"
+            if record.banner == "New!":
+                shop_time = "New!"
+                shop_time_flag = "new"
+                total_appearances = 1
+        else:
+            total_appearances = record.appearances
+            days_difference = record.daysSince
+            if total_appearances < 2:
+                shop_time = "New!"
+                shop_time_flag = "new"
+            elif days_difference == 1:
+                if record.streak > 1:
+                    shop_time = f"In for {record.streak} days"
+                    shop_time_flag = "consecutive"
+                else:
+                    shop_time = "1 day ago"
+                    shop_time_flag = "since"
+            else:
+                shop_time = f"{days_difference} days ago"
+                shop_time_flag = "since"
+        time_difference = record.outDate - datetime.now(timezone.utc)
+        leaves_text = f"{time_difference.days}d {time_difference.seconds // 3600}h"
+
+        if record.colors is not None:
+            if "color2" in record.colors:
                 gradient = [
-                    f"#{item['colors']['color1'][:6]}",
-                    f"#{item['colors']['color3'][:6]}",
-                    f"#{item['colors']['color2'][:6]}"
+                    f"#{record.colors['color1'][:6]}",
+                    f"#{record.colors['color3'][:6]}",
+                    f"#{record.colors['color2'][:6]}"
                 ]
-                textbgcolor = f"#{item["colors"]["color2"][:6]}"
+                textbgcolor = f"#{record.colors["color2"][:6]}"
             else:
                 gradient = [
-                    f"#{item['colors']['color1'][:6]}",
-                    f"#{item['colors']['color3'][:6]}"
+                    f"#{record.colors['color1'][:6]}",
+                    f"#{record.colors['color3'][:6]}"
                 ]
-                textbgcolor = f"#{item["colors"]["color3"][:6]}"
+                textbgcolor = f"#{record.colors["color3"][:6]}"
         else:
             log.warn(f"No colors for {name}")
             textbgcolor = "#000000"
@@ -586,14 +917,6 @@ class Athena:
                 for i in range(3)
             )
 
-        def create_rounded_rectangle_mask(image_width, image_height, radius):
-            mask = Image.new('L', (image_width, image_height), 0)
-            draw = ImageDraw.Draw(mask)
-            
-            draw.rounded_rectangle([(0, 0), (image_width, image_height)], radius=radius, fill=255)
-            
-            return mask
-
         def reduce_brightness(color, factor):
             r, g, b = color
             r = int(r * factor)
@@ -601,204 +924,306 @@ class Athena:
             b = int(b * factor)
             return (r, g, b)
 
-        def create_gradient_layer(image_width, image_height, color, fade_percentage, max_opacity, corner_radius, brightness_factor=0.7):
+        def create_gradient_layer(image_width, image_height, color, fade_percentage, max_opacity, rounded_mask, brightness_factor=0.7):
             color = reduce_brightness(color, brightness_factor)
             
             gradient = Image.new('RGBA', (image_width, image_height), color + (0,))
             
-            alpha_mask = Image.new('L', (image_width, image_height), 0)
-            draw = ImageDraw.Draw(alpha_mask)
-            
             fade_height = int(image_height * (1 - fade_percentage))
             
-            for y in range(image_height):
-                if y >= fade_height:
-                    opacity = int(max_opacity * (y - fade_height) / (image_height - fade_height))
-                    opacity = min(max_opacity, max(0, opacity))
-                else:
-                    opacity = 0
-                
-                draw.line([(0, y), (image_width, y)], fill=opacity)
-            
-            rounded_mask = create_rounded_rectangle_mask(image_width, image_height, corner_radius)
+            # Every row has a single opacity, build one column and stretch it across
+            column = bytearray(image_height)
+            for y in range(fade_height, image_height):
+                opacity = int(max_opacity * (y - fade_height) / (image_height - fade_height))
+                column[y] = min(max_opacity, max(0, opacity))
+
+            alpha_mask = Image.frombytes('L', (1, image_height), bytes(column))
+            alpha_mask = alpha_mask.resize((image_width, image_height), Image.NEAREST)
             alpha_mask = Image.composite(alpha_mask, Image.new('L', (image_width, image_height), 0), rounded_mask)
             
             gradient.putalpha(alpha_mask)
 
             return gradient
 
-        card = Image.new("RGBA", (340 * item["gridSize"], 545))
-
-        gradient_layer = Image.new("RGBA", card.size)
-        draw = ImageDraw.Draw(gradient_layer)
+        def render_base():
+            card = Image.new("RGBA", (340 * record.gridSize, 545))
 
-        height = card.height
+            height = card.height
 
-        for y in range(height):
-            factor = y / height
+            # Every row has a single color, build one column and stretch it across
+            column = bytearray()
+            for y in range(height):
+                factor = y / height
 
-            if len(gradient_rgb) == 2:
-                color = interpolate_color(gradient_rgb[0], gradient_rgb[1], factor)
+                if len(gradient_rgb) == 2:
+                    color = interpolate_color(gradient_rgb[0], gradient_rgb[1], factor)
+                else:
+                    if factor <= 0.5:
+                        blend_factor = factor * 2
+                        color = interpolate_color(gradient_rgb[0], gradient_rgb[1], blend_factor)
+                    else:
+                        adjusted_factor = (factor - 0.5) / 0.7
+                        blend_factor = min(adjusted_factor, 1)
+                        color = interpolate_color(gradient_rgb[1], gradient_rgb[2], blend_factor)
+
+                column.extend(color)
+                column.append(255)
+
+            gradient_layer = Image.frombytes("RGBA", (1, height), bytes(column))
+            gradient_layer = gradient_layer.resize(card.size, Image.NEAREST)
+
+            radius = 40
+            rounded_mask = AssetUtil.RoundedMask(self, card.size, radius)
+            card.paste(gradient_layer, (0, 0), mask=rounded_mask)
+            # Only the header is read here, the icon is decoded once its size is known
+            iconData = record.iconData
+            if iconData is not None:
+                icon = Image.open(io.BytesIO(iconData))
             else:
-                if factor <= 0.5:
-                    blend_factor = factor * 2
-                    color = interpolate_color(gradient_rgb[0], gradient_rgb[1], blend_factor)
+                # Not prefetched, try each icon in order of preference
+                icon = None
+                with metrics.Span("card.download", offerId=offerId):
+                    for url in record.icons:
+                        try:
+                            iconData = ImageUtil.DownloadBytes(self, url)
+                            if iconData is not None:
+                                icon = Image.open(io.BytesIO(iconData))
+                        except Exception as e:
+                            log.warn(f"Failed to download icon for {name}, {e}")
+                        if icon is not None:
+                            break
+                if icon is None:
+                    log.error(f"No icon available for {name}")
+
+                    return
+
+            if record.gridSize == 1:
+                if category == "outfit" or category == "bundle":
+                    if icon.width == 2048:
+                        scale = 1.1
+                    elif category == "bundle":
+                        if rarity == "racing":
+                            scale = 1.4
+                        else:
+                            scale = 1.8
+                    else:
+                        scale = 2.4
+                else:
+                    scale = 1.3
+            elif category == "outfit":
+                scale = 1.3
+            elif category == "bundle":
+                if rarity == "racing":
+                    scale = 1.2
                 else:
-                    adjusted_factor = (factor - 0.5) / 0.7
-                    blend_factor = min(adjusted_factor, 1)
-                    color = interpolate_color(gradient_rgb[1], gradient_rgb[2], blend_factor)
+                    scale = 1.1
+            elif rarity == "festival":
+                scale = 0.67
+            elif category == "shoe":
+                scale = 0.5
+            else:
+                scale = 1.2
+            if (category == "outfit") or (category == "emote"):
+                bounds = (285 * record.gridSize * scale, 365)
+            elif category == "wrap":
+                bounds = (230 * record.gridSize * scale, 310)
+            elif (category == "bundle"):
+                bounds = (285 * record.gridSize * scale, 365)
+            else:
+                bounds = (310 * record.gridSize * scale, 390)
 
-            draw.line([(0, y), (card.width, y)], fill=color)
+            with metrics.Span("card.decode", offerId=offerId):
+                icon = ImageUtil.DecodeResized(
+                    self, icon, iconData, ImageUtil.RatioSize(self, icon.size, *bounds)
+                )
 
+            if icon.mode != "RGBA":
+                icon = icon.convert("RGBA")
 
-        radius = 40
-        rounded_mask = create_rounded_rectangle_mask(card.width, card.height, radius)
-        card.paste(gradient_layer, (0, 0), mask=rounded_mask)
-        try:
-            icon = ImageUtil.Download(self, icon)
-        except Exception as e:
-            if "brItems" in item:
-                if "featured" in item["brItems"][0]["images"]:
-                    icon = item["brItems"][0]["images"]["featured"]
-                elif "icon" in item["brItems"][0]["images"]:
-                    icon = item["brItems"][0]["images"]["icon"]
+            if record.gridSize < 3:
+                if record.gridSize == 1 and category == "outfit":
+                    scale = 40
                 else:
-                    icon = item["brItems"][0]["images"]["smallIcon"]
-            elif "legoKits" in item:
-                icon = item["legoKits"][0]["images"]["small"]
-            elif "instruments" in item:
-                icon = item["instruments"][0]["images"]["large"]
-            elif "cars" in item:
-                icon = item["cars"][0]["images"]["large"]
+                    scale = 20
+            elif category == "bundle" and rarity == "racing":
+                scale = 50
             else:
-                icon = "https://None"
-            icon = ImageUtil.Download(self, icon)
+                scale = 30
+            card.paste(icon, ImageUtil.CenterX(self, icon.width, card.width, 35 - (scale * record.gridSize)), icon)
+            card.putalpha(rounded_mask)
+
+            if self.profile["fade"] is True:
+                gradient_layer = create_gradient_layer(card.width, card.height, ImageColor.getrgb(textbgcolor), 0.5, 255, rounded_mask)
+                card = Image.alpha_composite(card.convert('RGBA'), gradient_layer)
+
+            return card
+
+        def render_static():
+            # The same offer in another language only differs in its text
+            baseKey = (
+                record.gridSize,
+                record.category,
+                record.rarity,
+                record.icons,
+                json.dumps(record.colors, sort_keys=True),
+            )
 
-        if item["gridSize"] == 1:
-            if category == "outfit" or category == "bundle":
-                if icon.width == 2048:
-                    scale = 1.1
-                elif category == "bundle":
-                    if rarity == "racing":
-                        scale = 1.4
-                    else:
-                        scale = 1.8
-                else:
-                    scale = 2.4
+            if bases is not None and baseKey in bases:
+                card = bases[baseKey].copy()
             else:
-                scale = 1.3
-        elif category == "outfit":
-            scale = 1.3
-        elif category == "bundle":
-            if rarity == "racing":
-                scale = 1.2
-            else:
-                scale = 1.1
-        elif rarity == "festival":
-            scale = 0.67
-        elif category == "shoe":
-            scale = 0.5
-        else:
-            scale = 1.2
-        if (category == "outfit") or (category == "emote"):
-            icon = ImageUtil.RatioResize(self, icon, 285 * item["gridSize"] * scale, 365)
-        elif category == "wrap":
-            icon = ImageUtil.RatioResize(self, icon, 230 * item["gridSize"] * scale, 310)
-        elif (category == "bundle"):
-            icon = ImageUtil.RatioResize(self, icon, 285 * item["gridSize"] * scale, 365)
-        else:
-            icon = ImageUtil.RatioResize(self, icon, 310 * item["gridSize"] * scale, 390)
+                card = render_base()
 
-        if icon.mode != "RGBA":
-            icon = icon.convert("RGBA")
+                if card is None:
+                    return
 
-        if item["gridSize"] < 3:
-            if item["gridSize"] == 1 and category == "outfit":
-                scale = 40
-            else:
-                scale = 20
-        elif category == "bundle" and rarity == "racing":
-            scale = 50
-        else:
-            scale = 30
-        card.paste(icon, ImageUtil.CenterX(self, icon.width, card.width, 35 - (scale * item["gridSize"])), icon)
-        card.putalpha(rounded_mask)
+                if bases is not None:
+                    bases[baseKey] = card.copy()
 
-        gradient_layer = create_gradient_layer(card.width, card.height, ImageColor.getrgb(textbgcolor), 0.5, 255, 40)
-        card = Image.alpha_composite(card.convert('RGBA'), gradient_layer)
+            canvas = ImageDraw.Draw(card)
 
-        canvas = ImageDraw.Draw(card)
+            if record.bundle is True:
+                raritytext = "Bundle"
+                font = ImageUtil.Font(self, 36)
+                textWidth = ImageUtil.TextWidth(self, font, raritytext)
+                ImageUtil.Text(
+                    self,
+                    canvas,
+                    ImageUtil.CenterX(self, textWidth, card.width, 375),
+                    raritytext,
+                    blendColor,
+                    font=font,
+                )
+            else:
+                font = ImageUtil.Font(self, 36)
+                if (category == "legoprop"):
+                    cattext = "Lego Prop"
+                elif (category == "legoset"):
+                    cattext = "Lego Set"
+                else:
+                    cattext = f"{category.capitalize()}"
+
+                textWidth = ImageUtil.TextWidth(self, font, cattext)
+                ImageUtil.Text(
+                    self,
+                    canvas,
+                    ImageUtil.CenterX(self, textWidth, card.width, 375),
+                    cattext,
+                    blendColor,
+                    font=font,
+                )
 
-        if shop_time == "New!":
-            newborder = self.create_border_layer(card.size, border_size=13, radius=40, fillcolor='yellow')
-            card.paste(newborder, (0, 0), newborder)
-        elif "ago" in shop_time and days_difference >= 300:
-            newborder = self.create_border_layer(card.size, border_size=13, radius=40, fillcolor='red')
-            card.paste(newborder, (0, 0), newborder)           
+            vbucks = AssetUtil.VBucks(self)
 
-        if "bundle" in item and item["bundle"] is not None:
-            raritytext = "Bundle"
             font = ImageUtil.Font(self, 36)
-            textWidth, _ = font.getsize(raritytext)
-            canvas.text(
-                ImageUtil.CenterX(self, textWidth, card.width, 375),
-                raritytext,
+            price_text = str(f"{price:,}")
+            textWidth = ImageUtil.TextWidth(self, font, price_text)
+            ImageUtil.Text(
+                self,
+                canvas,
+                ImageUtil.CenterX(self, ((textWidth - 5) - vbucks.width), (card.width - 175), 490),
+                price_text,
                 blendColor,
                 font=font,
             )
-        else:
-            font = ImageUtil.Font(self, 36)
-            if (category == "legoprop"):
-                cattext = "Lego Prop"
-            elif (category == "legoset"):
-                cattext = "Lego Set"
-            else:
-                cattext = f"{category.capitalize()}"
 
-            textWidth, _ = font.getsize(cattext)
-            canvas.text(
-                ImageUtil.CenterX(self, textWidth, card.width, 375),
-                cattext,
-                blendColor,
+            card.paste(
+                vbucks,
+                ImageUtil.CenterX(self, (vbucks.width + (textWidth + 5)), (card.width - 175), 493),
+                vbucks,
+            )
+
+            font = ImageUtil.Font(self, 56)
+            textWidth = ImageUtil.TextWidth(self, font, name)
+            change = 0
+            if textWidth >= 270:
+                font, textWidth, change = ImageUtil.FitTextX(self, name, 56, 260 * record.gridSize)
+            ImageUtil.Text(
+                self,
+                canvas,
+                ImageUtil.CenterX(self, textWidth, card.width, (423 + (change / 2))),
+                name,
+                (255, 255, 255),
                 font=font,
             )
 
-        vbucks = ImageUtil.Open(self, "vbucks.png")
-        vbucks = ImageUtil.RatioResize(self, vbucks, 25, 25)
+            return card
+
+        cache = getattr(self, "cache", None)
+        card = None
+
+        # Cards without a prefetched icon are neither looked up nor stored
+        key = None if cache is None else Athena.CardKey(self, record)
+
+        if key is not None:
+            cached = cache.Get(key)
+
+            if cached is not None:
+                with metrics.Span("card.decode", offerId=offerId):
+                    card = Image.open(io.BytesIO(cached[0]))
+                    card.load()
+
+        if card is None:
+            card = render_static()
+
+            if card is None:
+                return
+
+            if key is not None:
+                buffer = io.BytesIO()
+                card.save(buffer, "PNG", compress_level=1)
+                cache.Put(key, buffer.getvalue())
+
+        # Everything below depends on the time of the run or the shop history
+        canvas = ImageDraw.Draw(card)
+        vbucks = AssetUtil.VBucks(self)
+
+        if self.profile["borders"] is True:
+            if shop_time == "New!":
+                newborder = AssetUtil.Border(self, card.size, 'yellow')
+                card.paste(newborder, (0, 0), newborder)
+            elif "ago" in shop_time and days_difference >= 300:
+                newborder = AssetUtil.Border(self, card.size, 'red')
+                card.paste(newborder, (0, 0), newborder)           
+
+
 
         font = ImageUtil.Font(self, 30)
-        if item["gridSize"] == 2:
-            refactorsize = (200 + (item["gridSize"] * 70))
-        elif item["gridSize"] > 2:
-            refactorsize = (220 + (item["gridSize"] * 60))
+        if record.gridSize == 2:
+            refactorsize = (200 + (record.gridSize * 70))
+        elif record.gridSize > 2:
+            refactorsize = (220 + (record.gridSize * 60))
         else:
-            refactorsize = (240 + (item["gridSize"] * 30))
+            refactorsize = (240 + (record.gridSize * 30))
         if shop_time_flag != "bundle":
             if total_appearances != 1:
-                textWidth, _ = font.getsize(f"{total_appearances} Visits")
-                canvas.text(
+                textWidth = ImageUtil.TextWidth(self, font, f"{total_appearances} Visits")
+                ImageUtil.Text(
+                    self,
+                    canvas,
                     ImageUtil.CenterX(self, ((textWidth / 2)), card.width - refactorsize, 378),
                     f"{total_appearances} Visits",
                     blendColor,
                     font=font,
                 )
             else:
-                if item["gridSize"] == 1:
+                if record.gridSize == 1:
                     offset = 381
                     font = ImageUtil.Font(self, 26)
                 else:
                     offset = 378
                     font = ImageUtil.Font(self, 30)
-                textWidth, _ = font.getsize(f"1 Visit!")
-                canvas.text(
+                textWidth = ImageUtil.TextWidth(self, font, f"1 Visit!")
+                ImageUtil.Text(
+                    self,
+                    canvas,
                     ImageUtil.CenterX(self, ((textWidth / 2)), card.width - refactorsize, offset),
                     f"First Visit!",
                     blendColor,
                     font=font,
                 )
         else:
-            if "banner" in item:
-                if item["gridSize"] == 1:
+            if record.banner is not None:
+                if record.gridSize == 1:
                     offset = 381
                     font = ImageUtil.Font(self, 24)
                     bonkset = offset - 2
@@ -806,13 +1231,15 @@ class Athena:
                     offset = 378
                     font = ImageUtil.Font(self, 30)
                     bonkset = offset
-                bannertext = item["banner"]["value"]
+                bannertext = record.banner
                 if "V-Bucks Off" in bannertext:
-                    discount = item["regularPrice"] - item["finalPrice"]
+                    discount = record.regularPrice - record.price
                     discount = str(f"{(discount):,}")
                     bannertext = f"{discount} Off"
-                    textWidth, _ = font.getsize(bannertext)
-                    canvas.text(
+                    textWidth = ImageUtil.TextWidth(self, font, bannertext)
+                    ImageUtil.Text(
+                        self,
+                        canvas,
                         ImageUtil.CenterX(self, ((textWidth / 2) - vbucks.width - 5), card.width - refactorsize, offset),
                         bannertext,
                         blendColor,
@@ -833,8 +1260,10 @@ class Athena:
                 #    )
 
         font = ImageUtil.Font(self, 30)
-        textWidth, _ = font.getsize(f"{leaves_text}")
-        canvas.text(
+        textWidth = ImageUtil.TextWidth(self, font, f"{leaves_text}")
+        ImageUtil.Text(
+            self,
+            canvas,
             ImageUtil.CenterX(self, ((textWidth / 2)), card.width + refactorsize - 80, 378),
             leaves_text,
             blendColor,
@@ -842,22 +1271,7 @@ class Athena:
         )
 
         font = ImageUtil.Font(self, 36)
-        price = str(f"{price:,}")
-        textWidth, _ = font.getsize(price)
-        canvas.text(
-            ImageUtil.CenterX(self, ((textWidth - 5) - vbucks.width), (card.width - 175), 490),
-            price,
-            blendColor,
-            font=font,
-        )
-
-        card.paste(
-            vbucks,
-            ImageUtil.CenterX(self, (vbucks.width + (textWidth + 5)), (card.width - 175), 493),
-            vbucks,
-        )
-
-        textWidth, _ = font.getsize(shop_time)
+        textWidth = ImageUtil.TextWidth(self, font, shop_time)
         if shop_time_flag == "new":
             shop_time_paste = ImageUtil.CenterX(self, ((textWidth - 20)), (card.width + textWidth * 2.5), 490)
         elif shop_time_flag == "bundle":
@@ -866,31 +1280,35 @@ class Athena:
             shop_time_paste = ImageUtil.CenterX(self, ((textWidth - 10)), (card.width + textWidth / 1.5), 490)
         elif shop_time_flag == "since":
             shop_time_paste = ImageUtil.CenterX(self, ((textWidth - 5)), (card.width + textWidth - 25), 490)
-        canvas.text(
+        ImageUtil.Text(
+            self,
+            canvas,
             shop_time_paste,
             shop_time,
             blendColor,
             font=font,
         )
 
-        font = ImageUtil.Font(self, 56)
-        textWidth, _ = font.getsize(name)
-        change = 0
-        if textWidth >= 270:
-            font, textWidth, change = ImageUtil.FitTextX(self, name, 56, 260 * item["gridSize"])
-        canvas.text(
-            ImageUtil.CenterX(self, textWidth, card.width, (423 + (change / 2))),
-            name,
-            (255, 255, 255),
-            font=font,
-        )
+        if record.targetSize is not None and card.size != record.targetSize:
+            card = card.resize(record.targetSize, self.resample)
 
         return card
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fortnite Item Shop Generator.")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="keep running and post whenever the Item Shop changes, instead of once",
+    )
+    arguments = parser.parse_args()
+
     try:
-        Athena.main(Athena)
+        if arguments.daemon is True:
+            Athena.Daemon(Athena)
+        else:
+            Athena.main(Athena)
     except KeyboardInterrupt:
         log.info("Exiting...")
         exit()
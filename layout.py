@@ -0,0 +1,216 @@
+import math
+from math import ceil
+from typing import NamedTuple
+
+# Dimensions of a single grid unit of a card
+CARD_WIDTH = 340
+CARD_HEIGHT = 545
+
+# Number of grid units in a section row
+BLOCK_WIDTH = 4
+
+# Space between section columns, and above each section for its header
+GAP_SIZE = 250
+
+
+class Placement(NamedTuple):
+    """Rectangle of a card on the Item Shop image."""
+
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class Header(NamedTuple):
+    """
+    Position of a section header on the Item Shop image.
+
+    The header is drawn at ImageUtil.CenterX(textWidth, x + textWidth, y).
+    """
+
+    text: str
+    x: int
+    y: int
+
+
+class Plan(NamedTuple):
+    """Placement of every card and section header, and the resulting image size."""
+
+    rows: int
+    columns: int
+    width: int
+    height: int
+    cards: list
+    headers: list
+
+
+class Layout:
+    """Class containing the placement of cards on the Item Shop image."""
+
+    def Grid(self, num_items: int):
+        """Return the number of rows and columns of grid units for the specified number of grid units."""
+
+        rows_raw = math.ceil(num_items / 4)
+        columns_raw = math.ceil(math.sqrt(rows_raw)) * 2
+        if num_items <= 6:
+            columns = columns_raw
+        elif num_items <= 8:
+            columns = columns_raw + 1
+        else:
+            columns = columns_raw + 5
+        if (columns % 4) > 0:
+            columns += 4 - (columns % 4)
+        if columns < 4:
+            columns = 4
+        rows = math.ceil(num_items / columns) + 1
+
+        return rows, columns
+
+    def Plan(self, items: list):
+        """
+        Return the placement plan for the provided list of (layout name, grid size)
+        tuples, which must already be in display order.
+
+        Sections are stacked vertically and wrap into a new column of sections
+        once the row limit is reached. Cards wider than the space left in the
+        current row start on the next row.
+        """
+
+        num_items = sum(grid_size for _, grid_size in items)
+        rows, columns = Layout.Grid(self, num_items)
+
+        block_width = BLOCK_WIDTH
+        gap_size = GAP_SIZE
+        card_height = CARD_HEIGHT
+        rowsabove = 1
+        rowcount = 1
+        metacolumn = 1
+        position = 0
+        metaposition = 0
+
+        previous_layout = None
+        block_x_offset = 0
+        block_y_offset = 0
+        current_position = 0
+        block_y_offset_alt = 0
+        previous_offset = 0
+        cards = []
+        headers = []
+
+        for current_layout, grid_size in items:
+            metaposition += grid_size
+            card_width = CARD_WIDTH * grid_size
+            rowcount = ceil(metaposition / block_width)
+            if current_layout != previous_layout:
+                adjust = (metaposition - grid_size) % 4
+                if adjust > 0:
+                    metaposition += 4 - adjust
+                rowcount = ceil(metaposition / block_width)
+            if rowcount > rows:
+                metacolumn += 1
+                block_x_offset += (CARD_WIDTH * 4) + gap_size
+                metaposition = grid_size
+                block_y_offset_alt = card_height + gap_size
+                rowcount = ceil(metaposition / block_width)
+                current_position = 0
+            if current_layout != previous_layout:
+                current_position = 0
+                rowsabove = 1
+                block_y_offset += (card_height * rowsabove) + gap_size + previous_offset
+                if block_y_offset_alt > 0:
+                    block_y_offset = (card_height * rowsabove) + gap_size
+                    block_y_offset_alt = 0
+                textscale = 1
+                if metacolumn > 1:
+                    textscale = 2
+                headers.append(
+                    Header(current_layout, (textscale * block_x_offset) + 450, block_y_offset - 130)
+                )
+                position = grid_size
+                previous_layout = current_layout
+            else:
+                position += grid_size
+                rowsabove = ceil(position / block_width)
+                if block_y_offset_alt > 0:
+                    rowsabove = 1
+                    block_y_offset = (card_height * rowsabove) + gap_size
+                    block_y_offset_alt = 0
+                    current_position = 0
+            if ((grid_size == 4) and ((current_position + grid_size) % block_width) > 0) or ((grid_size >= 3) and ((current_position % 4) >= 2)) or ((grid_size >= 2) and ((current_position % 4) >= 3)):
+                adjust = (4 - (current_position % block_width))
+                current_position += adjust
+                position += adjust
+                metaposition += adjust
+                rowcount = ceil(metaposition / block_width)
+            x_position = block_x_offset + (current_position % block_width) * (card_width // grid_size + 5) + 230
+            y_position = block_y_offset + ((current_position // block_width) * (card_height + 5))
+            previous_offset = y_position - block_y_offset
+            cards.append(Placement(x_position, y_position, card_width, card_height))
+            current_position += grid_size
+
+        width = max(card.x + card.width for card in cards) + 230
+        height = max(card.y + card.height for card in cards) + 100
+
+        return Plan(rows, columns, width, height, cards, headers)
+
+    def TitleSizes(self, columns: int):
+        """
+        Return the date, creator code and subreddit font sizes followed by the
+        title and date distance from the top and their horizontal push for the
+        specified number of columns.
+        """
+
+        ranges = {
+            (1, 4): (16, 26, 26, 380, 540, 150),
+            (5, 8): (14, 24, 24, 160, 440, 200),
+            (9, 12): (12, 21, 21, 70, 410, 200),
+            (13, 16): (10, 17, 17, 70, 430, 200),
+            (17, 23): (7, 13, 13, 70, 430, 200),
+            (24, 27): (6, 11, 11, 80, 430, 200),
+            (28, 31): (5, 9, 9, 90, 430, 200),
+            (32, 35): (4, 8, 8, 120, 460, 200),
+            (36, float('inf')): (4, 8, 8, 100, 460, 200)
+        }
+
+        for (start, end), values in ranges.items():
+            if start <= columns <= end:
+                datesize, codesize, subfontsize, title_top, date_top, push = values
+
+                return datesize * columns, codesize * columns, subfontsize * columns, title_top, date_top, push
+
+    def Scale(self, plan: Plan, scale: float):
+        """
+        Return the provided plan scaled by the specified factor.
+
+        Edges are floored so that neighbouring cards keep sharing an edge.
+        """
+
+        if scale == 1:
+            return plan
+
+        cards = []
+        for card in plan.cards:
+            x, y = math.floor(card.x * scale), math.floor(card.y * scale)
+            cards.append(
+                Placement(
+                    x,
+                    y,
+                    math.floor((card.x + card.width) * scale) - x,
+                    math.floor((card.y + card.height) * scale) - y,
+                )
+            )
+
+        headers = [
+            Header(header.text, math.floor(header.x * scale), math.floor(header.y * scale))
+            for header in plan.headers
+        ]
+
+        return Plan(
+            plan.rows,
+            plan.columns,
+            math.floor(plan.width * scale),
+            math.floor(plan.height * scale),
+            cards,
+            headers,
+        )
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from time import perf_counter
+
+log = logging.getLogger(__name__)
+
+
+class Metrics:
+    """
+    Collects the time spent in each stage of a run.
+
+    Spans recorded by pool workers are returned to the parent process and
+    merged, so a single run report covers every process.
+    """
+
+    def __init__(self):
+        self.started = datetime.now(timezone.utc)
+        self.spans = []
+        self.values = {}
+
+    @contextmanager
+    def Span(self, name: str, **labels):
+        """Record the time spent within the context as the specified stage."""
+
+        start = perf_counter()
+
+        try:
+            yield
+        finally:
+            Metrics.Add(self, name, perf_counter() - start, **labels)
+
+    def Add(self, name: str, seconds: float, **labels):
+        """Record the specified time spent in the specified stage."""
+
+        self.spans.append(dict(labels, name=name, seconds=seconds))
+
+    def Merge(self, spans: list):
+        """Add the provided spans, recorded by another process, to this run."""
+
+        self.spans.extend(spans)
+
+    def Set(self, name: str, value: float):
+        """Record the specified value of the run, such as the output size."""
+
+        self.values[name] = value
+
+    def Stages(self):
+        """Return the count, total and maximum time of every stage."""
+
+        stages = {}
+
+        for span in self.spans:
+            stage = stages.setdefault(span["name"], {"count": 0, "total": 0, "max": 0})
+            stage["count"] += 1
+            stage["total"] += span["seconds"]
+            stage["max"] = max(stage["max"], span["seconds"])
+
+        return stages
+
+    def Report(self):
+        """Return the run report as a dictionary."""
+
+        cards = {}
+
+        # Card spans are grouped per offer, every other span is a stage of the run
+        for span in self.spans:
+            if "offerId" in span:
+                card = cards.setdefault(span["offerId"], {"offerId": span["offerId"]})
+                stage = span["name"].split(".", 1)[-1]
+                card[stage] = card.get(stage, 0) + span["seconds"]
+
+        return {
+            "started": self.started.isoformat(),
+            "stages": Metrics.Stages(self),
+            "values": self.values,
+            "cards": list(cards.values()),
+        }
+
+    def Prometheus(self):
+        """Return the run metrics in the Prometheus text exposition format."""
+
+        lines = [
+            "# HELP athena_stage_seconds_total Time spent in each stage of the last run.",
+            "# TYPE athena_stage_seconds_total gauge",
+        ]
+        stages = Metrics.Stages(self)
+
+        for name, stage in sorted(stages.items()):
+            lines.append(f'athena_stage_seconds_total{{stage="{name}"}} {stage["total"]:.6f}')
+
+        lines += [
+            "# HELP athena_stage_seconds_max Longest single span of each stage of the last run.",
+            "# TYPE athena_stage_seconds_max gauge",
+        ]
+        for name, stage in sorted(stages.items()):
+            lines.append(f'athena_stage_seconds_max{{stage="{name}"}} {stage["max"]:.6f}')
+
+        lines += [
+            "# HELP athena_stage_count Number of spans of each stage of the last run.",
+            "# TYPE athena_stage_count gauge",
+        ]
+        for name, stage in sorted(stages.items()):
+            lines.append(f'athena_stage_count{{stage="{name}"}} {stage["count"]}')
+
+        for name, value in sorted(self.values.items()):
+            lines += [f"# TYPE athena_{name} gauge", f"athena_{name} {value}"]
+
+        lines += [
+            "# HELP athena_last_run_timestamp_seconds Start time of the last run.",
+            "# TYPE athena_last_run_timestamp_seconds gauge",
+            f"athena_last_run_timestamp_seconds {self.started.timestamp():.0f}",
+        ]
+
+        return "\n".join(lines) + "\n"
+
+    def Write(self, report: str = None, prometheus: str = None):
+        """
+        Write the run report and the Prometheus textfile collector file to the
+        specified paths, either may be omitted.
+        """
+
+        for path, contents in (
+            (report, lambda: json.dumps(Metrics.Report(self), indent=4)),
+            (prometheus, lambda: Metrics.Prometheus(self)),
+        ):
+            if path is None:
+                continue
+
+            try:
+                directory = os.path.dirname(os.path.abspath(path))
+                os.makedirs(directory, exist_ok=True)
+
+                # The textfile collector must never read a partially written file
+                handle, temporary = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(handle, "w", encoding="utf-8") as file:
+                    file.write(contents())
+                os.replace(temporary, path)
+            except OSError as e:
+                log.error(f"Failed to write metrics to {path}, {e}")
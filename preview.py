@@ -0,0 +1,253 @@
+"""
+Local preview of the Item Shop cards and image.
+
+A recorded /v2/shop payload is loaded once and every card is rendered on
+request, so edits to assets/images and assets/fonts show up on the next
+refresh without running the whole generator. Rendered cards are kept in
+memory until an asset changes.
+
+    python3 benchmark.py --record recording/
+    python3 preview.py recording/
+    python3 preview.py shop.json --port 8080 --offline
+
+The Item Shop image is served at /shop.png and each card at /card/<offerId>.png.
+"""
+
+import argparse
+import html
+import io
+import json
+import logging
+import os
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from time import perf_counter
+from urllib.parse import quote, unquote, urlsplit
+
+from assets import AssetUtil
+from benchmark import Recording
+from itemshop import Athena
+from metrics import Metrics
+from records import Record, Records
+from util import Utility
+
+log = logging.getLogger(__name__)
+
+
+class Preview:
+    """Renders the cards and image of a loaded Item Shop on request."""
+
+    def __init__(self, path: str, capacity: int, offline: bool):
+        self.capacity = capacity
+        self.offline = offline
+        self.cards = OrderedDict()
+        self.icons = {}
+
+        if os.path.isdir(path):
+            recording = Recording.Load(path)
+            self.shop = recording.shop
+            self.icons = recording.icons
+        else:
+            with open(path, "r", encoding="utf-8") as file:
+                shop = json.load(file)
+
+            # Either a full /v2/shop response or only its data
+            self.shop = shop.get("data", shop)
+
+        self.date = Utility.ISOtoHuman(Athena, self.shop["date"].split("T")[0], Athena.language)
+        self.records = {}
+
+        for item in self.shop["entries"]:
+            record = Records.Normalize(Athena, item)
+
+            if record is not None:
+                self.records[record.offerId] = record
+
+        log.info(f"Loaded {len(self.records)} cards of the Item Shop for {self.date}")
+
+    def Refresh(self):
+        """Forget every rendered card if an asset was edited since they were rendered."""
+
+        if AssetUtil.Reload(Athena) is True and len(self.cards) > 0:
+            log.info(f"Assets changed, forgetting {len(self.cards)} rendered cards")
+
+            self.cards.clear()
+
+    def Icon(self, record: Record):
+        """
+        Return the raw bytes of the first icon of the provided record which is
+        available locally, from the recording or the cache, or None.
+        """
+
+        for url in record.icons:
+            name = Recording.Name(url)
+
+            if name in self.icons:
+                return self.icons[name]
+
+            if Athena.cache is not None:
+                cached = Athena.cache.Get(url)
+
+                if cached is not None:
+                    return cached[0]
+
+    def Card(self, record: Record):
+        """Return the card image of the provided record, rendering it if it is not in memory."""
+
+        key = (record.offerId, record.targetSize)
+
+        if key in self.cards:
+            self.cards.move_to_end(key)
+
+            return self.cards[key]
+
+        icon = Preview.Icon(self, record)
+        if icon is not None:
+            record = record._replace(iconData=icon)
+        elif self.offline is True:
+            # Nothing left to download from
+            record = record._replace(icons=())
+
+        card, _ = Athena.RenderCard(Athena, record)
+
+        self.cards[key] = card
+        while len(self.cards) > self.capacity:
+            self.cards.popitem(last=False)
+
+        return card
+
+    def Shop(self):
+        """Return the encoded Item Shop image, composed from the cards in memory."""
+
+        Athena.metrics = Metrics()
+
+        shop = Athena.PrepareImage(Athena, self.date, self.shop)
+
+        if shop is None:
+            return
+
+        shop["cards"] = []
+        for record, placement in zip(shop["records"], shop["target"].cards):
+            if record is None:
+                shop["cards"].append(None)
+
+                continue
+
+            if shop["scale"] != 1:
+                record = record._replace(targetSize=(placement.width, placement.height))
+
+            shop["cards"].append(Preview.Card(self, record))
+
+        result = Athena.ComposeImage(Athena, shop, None, False)
+
+        if result is not None:
+            return result.data
+
+    def Index(self):
+        """Return the page linking to the Item Shop image and every card."""
+
+        links = "".join(
+            f'<li><a href="/card/{html.escape(quote(offerId))}.png">{html.escape(record.name)}</a></li>'
+            for offerId, record in self.records.items()
+        )
+
+        return f'<h1>{html.escape(self.date)}</h1><p><a href="/shop.png">Item Shop</a></p><ul>{links}</ul>'.encode("utf-8")
+
+    def Respond(self, path: str):
+        """Return the body and content type of the provided request path, or None if it does not exist."""
+
+        Preview.Refresh(self)
+
+        if path == "/":
+            return Preview.Index(self), "text/html; charset=utf-8"
+        elif path == "/shop.png":
+            body = Preview.Shop(self)
+        elif path.startswith("/card/") and path.endswith(".png"):
+            record = self.records.get(path[6:-4])
+
+            if record is None:
+                return
+
+            card = Preview.Card(self, record)
+
+            if card is None:
+                return
+
+            buffer = io.BytesIO()
+            card.save(buffer, "PNG", compress_level=1)
+            body = buffer.getvalue()
+        else:
+            return
+
+        if body is not None:
+            return body, "image/png"
+
+    def Handler(preview):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                path = unquote(urlsplit(self.path).path)
+                start = perf_counter()
+
+                try:
+                    response = Preview.Respond(preview, path)
+                except Exception as e:
+                    log.error(f"Failed to render {path}, {e}")
+
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+
+                if response is None:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                body, contentType = response
+
+                self.send_response(200)
+                self.send_header("Content-Type", contentType)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Cache-Control", "no-store")
+                self.end_headers()
+                self.wfile.write(body)
+
+                log.info(f"Served {path} in {(perf_counter() - start) * 1000:.0f}ms")
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local preview of the Item Shop cards and image.")
+    parser.add_argument("shop", metavar="PATH", help="recording directory of benchmark.py, or a /v2/shop JSON file")
+    parser.add_argument("--port", type=int, default=8000, help="port to serve the preview on")
+    parser.add_argument("--configuration", metavar="FILE", default="configuration.json", help="configuration.json values to render with")
+    parser.add_argument("--profile", choices=("draft", "standard", "final"), help="render profile, overriding the configuration")
+    parser.add_argument("--cards", type=int, default=512, help="number of rendered cards kept in memory")
+    parser.add_argument("--offline", action="store_true", help="never download icons missing from the recording and cache")
+    arguments = parser.parse_args()
+
+    configuration = {"delayStart": 0, "language": "en"}
+    if os.path.exists(arguments.configuration):
+        with open(arguments.configuration, "r", encoding="utf-8") as file:
+            configuration.update(json.load(file))
+
+    # Previews are never posted, saved or recorded to the shop history
+    for section in ("discord", "reddit", "directory", "history"):
+        configuration[section] = {"enabled": False}
+    configuration["output"] = {"format": "png", "optimize": False, "compressLevel": 1, "path": None}
+    if arguments.profile is not None:
+        configuration.setdefault("render", {})["profile"] = arguments.profile
+
+    if Athena.ApplyConfiguration(Athena, configuration) is True:
+        preview = Preview(arguments.shop, arguments.cards, arguments.offline)
+        server = HTTPServer(("127.0.0.1", arguments.port), Preview.Handler(preview))
+
+        log.info(f"Serving the preview at http://127.0.0.1:{arguments.port}/")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            log.info("Exiting...")
@@ -0,0 +1,334 @@
+import asyncio
+import io
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import perf_counter
+
+from encoder import EncodedImage
+from metrics import Metrics
+
+log = logging.getLogger(__name__)
+
+
+class Publisher(ABC):
+    """
+    Destination the Item Shop image is posted to.
+
+    Publishers import their SDK when publishing rather than at startup, so
+    render-only runs and the card rendering pool never load them.
+
+    Publishers which are not idempotent check for the post of a previous
+    attempt before posting again.
+    """
+
+    name = "publisher"
+    idempotent = False
+
+    def __init__(self, configuration: dict):
+        self.configuration = configuration
+        self.timeout = configuration.get("timeout", 120)
+        self.retries = configuration.get("retries", 3)
+        self.backoff = configuration.get("backoff", 5)
+        self.language = configuration.get("language")
+        self.variant = configuration.get("variant")
+
+    @abstractmethod
+    async def PublishAsync(self, image: EncodedImage, metrics: Metrics, retrying: bool):
+        """
+        Post the provided encoded Item Shop image without blocking the event
+        loop, unless retrying and a previous attempt already posted it.
+        """
+
+
+class BlockingPublisher(Publisher):
+    """Publisher whose SDK blocks, it posts from a thread rather than the event loop."""
+
+    @abstractmethod
+    def Publish(self, image: EncodedImage, metrics: Metrics, retrying: bool):
+        """
+        Post the provided encoded Item Shop image, unless retrying and a
+        previous attempt already posted it.
+
+        Every request must have a timeout, as the thread of an attempt which
+        timed out is abandoned rather than interrupted.
+        """
+
+    async def PublishAsync(self, image: EncodedImage, metrics: Metrics, retrying: bool):
+        # Not the default executor, which asyncio.run waits for before returning
+        executor = ThreadPoolExecutor(1)
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(executor, self.Publish, image, metrics, retrying)
+        finally:
+            executor.shutdown(wait=False)
+
+
+class DiscordPublisher(Publisher):
+    """Posts the Item Shop image to a Discord channel."""
+
+    name = "discord"
+
+    def __init__(self, configuration: dict):
+        super().__init__(configuration)
+
+        self.token = configuration["TOKEN"]  # should be a string, with quotes
+        self.channel = configuration["CHANNEL_ID"]  # should be an integer, no quotes
+
+    async def PublishAsync(self, image: EncodedImage, metrics: Metrics, retrying: bool):
+        import discord
+        from discord.ext import commands
+
+        intents = discord.Intents.default()  # Use default intents
+        intents.message_content = True       # Enable the MESSAGE_CONTENT intent (if you need to read message content)
+        intents.messages = True              # Enable the MESSAGES intent (if you need to receive message events)
+
+        bot = commands.Bot(command_prefix='!', intents=intents)
+        login = perf_counter()
+        posted = asyncio.get_running_loop().create_future()
+
+        @bot.event
+        async def on_ready():
+            # on_ready is dispatched again after a reconnect
+            if posted.done():
+                return
+            metrics.Add("discord.login", perf_counter() - login)
+            print(f'Logged in as {bot.user.name} ({bot.user.id})')
+            channel = bot.get_channel(self.channel)
+            try:
+                if channel is None:
+                    raise LookupError(f"channel {self.channel} not found")
+                current_date = datetime.utcnow().strftime('%B %d, %Y')
+                content = f"Daily Item Shop {current_date}:"
+                sent = False
+                if retrying is True:
+                    # A failed attempt may have failed after sending
+                    sent = any([
+                        message async for message in channel.history(limit=10)
+                        if message.author == bot.user and message.content == content
+                    ])
+                if sent is True:
+                    log.info(f"Already posted to channel {self.channel}, not posting again")
+                else:
+                    await channel.send(
+                        content,
+                        file=discord.File(io.BytesIO(image.data), image.filename),
+                    )
+                posted.set_result(True)
+            except Exception as e:
+                posted.set_exception(e)
+            await bot.close()
+
+        @bot.command()
+        async def upload(ctx):
+            current_date = datetime.utcnow().strftime('%B %d, %Y')
+            await ctx.send(
+                f"Daily Item Shop {current_date}:",
+                file=discord.File(io.BytesIO(image.data), image.filename),
+            )
+            await bot.close()
+
+        # Closes the bot, along with its pending requests, when cancelled by the timeout
+        async with bot:
+            await bot.start(self.token)
+
+        if not posted.done():
+            raise ConnectionError("disconnected before posting")
+
+        posted.result()
+
+
+class RedditPublisher(BlockingPublisher):
+    """Submits the Item Shop image to a Subreddit."""
+
+    name = "reddit"
+
+    def __init__(self, configuration: dict):
+        super().__init__(configuration)
+
+        self.client_id = configuration["client_id"]
+        self.client_secret = configuration["client_secret"]
+        self.user_agent = configuration["user_agent"]
+        self.username = configuration["username"]
+        self.password = configuration["password"]
+        self.sub_reddit = configuration["sub_reddit"]
+        self.flair_id = configuration["flair_id"]
+
+    def Publish(self, image: EncodedImage, metrics: Metrics, retrying: bool):
+        import praw
+        import requests
+
+        timeout = max(1, round(self.timeout))
+
+        class Session(requests.Session):
+            # praw uploads images outside of its own request timeout
+            def request(self, *args, **kwargs):
+                if kwargs.get("timeout") is None:
+                    kwargs["timeout"] = timeout
+
+                return super().request(*args, **kwargs)
+
+        reddit = praw.Reddit(
+            client_id=self.client_id,
+            client_secret=self.client_secret,
+            user_agent=self.user_agent,
+            username=self.username,
+            password=self.password,
+            timeout=timeout,
+            requestor_kwargs={"session": Session(), "timeout": timeout},
+        )
+
+        print(reddit.read_only)
+        # Output: False
+
+        formatted_date = datetime.utcnow().strftime('%Y-%m-%d')
+        title = f"Daily Item Shop and Purchase Advice Megathread ({formatted_date})"
+
+        if retrying is True:
+            # A failed attempt may have failed after submitting
+            for submission in reddit.user.me().submissions.new(limit=10):
+                if submission.title == title and submission.subreddit.display_name.lower() == self.sub_reddit.lower():
+                    log.info(f"Already submitted to r/{self.sub_reddit}, not submitting again")
+
+                    return
+
+        # praw only uploads images from a file
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, image.filename)
+            with open(path, "wb") as file:
+                file.write(image.data)
+
+            # Waiting on the websocket for the submission can fail after it was created
+            reddit.subreddit(self.sub_reddit).submit_image(
+                title=title, image_path=path, flair_id=self.flair_id, without_websockets=True
+            )
+
+
+class DirectoryPublisher(BlockingPublisher):
+    """Keeps a dated copy of every Item Shop image in a local directory."""
+
+    name = "directory"
+    idempotent = True
+
+    def __init__(self, configuration: dict):
+        super().__init__(configuration)
+
+        self.directory = configuration.get("path", "shops/")
+
+    def Publish(self, image: EncodedImage, metrics: Metrics, retrying: bool):
+        os.makedirs(self.directory, exist_ok=True)
+
+        destination = os.path.join(
+            self.directory, f"itemshop-{datetime.utcnow().strftime('%Y-%m-%d')}.{image.extension}"
+        )
+
+        with open(destination, "wb") as file:
+            file.write(image.data)
+        log.info(f"Saved Item Shop image to {destination}")
+
+
+# Publisher of each section of configuration.json
+PUBLISHERS = {
+    "discord": DiscordPublisher,
+    "reddit": RedditPublisher,
+    "directory": DirectoryPublisher,
+}
+
+
+def create_publishers(configuration: dict):
+    """Return a publisher for every section of the provided configuration which is enabled."""
+
+    return [
+        publisher(configuration[section])
+        for section, publisher in PUBLISHERS.items()
+        if configuration.get(section, {}).get("enabled", False) is True
+    ]
+
+
+async def publish(publisher: Publisher, image: EncodedImage, metrics: Metrics):
+    """
+    Post the provided encoded Item Shop image using the provided publisher, retrying with an exponential backoff.
+
+    An attempt which timed out may still have posted, it is only retried for
+    idempotent publishers and is otherwise reported as timed out.
+
+    Return a dictionary of the status of the post.
+    """
+
+    delay = publisher.backoff
+    start = perf_counter()
+
+    if publisher.variant is not None:
+        if publisher.variant in (image.variants or {}):
+            image = image.variants[publisher.variant]
+        else:
+            log.warning(f"No {publisher.variant} output variant for {publisher.name}, posting the full size image")
+
+    for attempt in range(1, publisher.retries + 2):
+        try:
+            await asyncio.wait_for(publisher.PublishAsync(image, metrics, attempt > 1), publisher.timeout)
+
+            metrics.Add(publisher.name, perf_counter() - start)
+
+            return {"status": "published", "attempts": attempt, "seconds": perf_counter() - start}
+        except asyncio.TimeoutError:
+            error = f"no response within {publisher.timeout}s"
+
+            if publisher.idempotent is False:
+                metrics.Add(publisher.name, perf_counter() - start)
+
+                return {"status": "timed out", "attempts": attempt, "seconds": perf_counter() - start, "error": error}
+        except Exception as e:
+            error = str(e) or type(e).__name__
+
+        if attempt > publisher.retries:
+            break
+
+        log.warning(f"Failed to publish to {publisher.name} (attempt {attempt}), retrying in {delay}s, {error}")
+
+        await asyncio.sleep(delay)
+        delay *= 2
+
+    metrics.Add(publisher.name, perf_counter() - start)
+
+    return {"status": "failed", "attempts": attempt, "seconds": perf_counter() - start, "error": error}
+
+
+async def publish_concurrently(publishers: list, image: EncodedImage, metrics: Metrics):
+    """Return the status of posting the encoded Item Shop image to every provided publisher at once."""
+
+    results = await asyncio.gather(
+        *(publish(publisher, image, metrics) for publisher in publishers)
+    )
+
+    return dict(zip((publisher.name for publisher in publishers), results))
+
+
+def publish_all(publishers: list, image: EncodedImage, metrics: Metrics):
+    """
+    Post the provided encoded Item Shop image to every provided publisher
+    concurrently, a failing publisher never holds up the others as every
+    attempt is bounded by its timeout.
+
+    Return the status of each publisher, which is also logged as a summary.
+    """
+
+    if len(publishers) == 0:
+        return {}
+
+    summary = asyncio.run(publish_concurrently(publishers, image, metrics))
+
+    for name, result in summary.items():
+        metrics.Set(f"published_{name}", int(result["status"] == "published"))
+
+        if result["status"] == "published":
+            log.info(f"Published to {name} in {result['seconds']:.2f}s, attempt {result['attempts']}")
+        elif result["status"] == "timed out":
+            log.error(f"Timed out publishing to {name} on attempt {result['attempts']}, it may have been posted, {result['error']}")
+        else:
+            log.error(f"Failed to publish to {name} after {result['attempts']} attempts, {result['error']}")
+
+    return summary
@@ -0,0 +1,189 @@
+import logging
+from datetime import datetime
+from typing import NamedTuple
+
+log = logging.getLogger(__name__)
+
+# Sections of an Item Shop entry which describe the items it contains
+ITEM_TYPES = ("tracks", "brItems", "legoKits", "instruments", "cars")
+
+
+class Record(NamedTuple):
+    """
+    Fields of an Item Shop entry needed to render its card.
+
+    Records are what the card rendering pool receives, rather than the full
+    entry along with its shop history and display assets.
+    """
+
+    offerId: str
+    name: str
+    category: str
+    rarity: str
+    gridSize: int
+    price: int
+    regularPrice: int
+    banner: str
+    bundle: bool
+    colors: dict
+    icons: tuple
+    outDate: datetime
+    appearances: int
+    daysSince: int
+    streak: int
+    iconData: bytes = None
+    iconDigest: str = None
+    targetSize: tuple = None
+
+
+def title_case(text):
+    words = text.split()
+    formatted_words = []
+    for word in words:
+        formatted_word = word[0].upper() + word[1:].lower()
+        formatted_word = formatted_word.replace("'S", "'s")
+        formatted_words.append(formatted_word)
+    return ' '.join(formatted_words)
+
+
+class Records:
+    """Class containing the normalization of Item Shop entries into records."""
+
+    def Normalize(self, item: dict, history: tuple = None):
+        """
+        Return the record of the provided Item Shop entry, or None if it could not be parsed.
+
+        If provided, the (appearances, daysSince, streak) of the entry from the
+        local shop history are used instead of parsing its shopHistory.
+        """
+
+        name = rarity = category = price = None
+
+        try:
+            bundle = "bundle" in item and item["bundle"] is not None
+            first = None
+            for key in ("brItems", "legoKits", "instruments", "cars"):
+                if key in item:
+                    first = item[key][0]
+
+                    break
+
+            if bundle is True:
+                name = title_case(item["bundle"]["name"])
+                category = "bundle"
+            elif first is not None:
+                name = first["name"]
+                category = first["type"]["value"]
+            else:
+                name = "Unknown"
+                category = "Unknown"
+
+            if "brItems" in item:
+                try:
+                    rarity = item["brItems"][0]["rarity"]["value"]
+                except Exception as e:
+                    rarity = "common"
+                if rarity == "gaminglegends":
+                    rarity = "gaming"
+            elif "legoKits" in item:
+                rarity = "lego"
+            elif "instruments" in item:
+                rarity = "festival"
+            elif "cars" in item:
+                rarity = "racing"
+            else:
+                rarity = "common"
+            price = item["finalPrice"]
+
+            appearances, daysSince, streak = 0, None, 0
+            if bundle is False:
+                if history is not None:
+                    appearances, daysSince, streak = history
+                else:
+                    appearances, daysSince, streak = Records.History(self, item)
+
+            return Record(
+                item.get("offerId"),
+                name,
+                category,
+                rarity,
+                int(item["tileSize"].split("_")[1]),
+                price,
+                item.get("regularPrice", price),
+                (item.get("banner") or {}).get("value"),
+                bundle,
+                item.get("colors"),
+                tuple(Records.IconURLs(self, item)),
+                datetime.fromisoformat(item["outDate"].replace('Z', '+00:00')),
+                appearances,
+                daysSince,
+                streak,
+            )
+        except Exception as e:
+            log.error(f"Failed to parse item {name} ({rarity}/{category}/{price}), {e}")
+
+    def History(self, item: dict):
+        """
+        Return the number of appearances of the provided Item Shop entry, the
+        days between its last two appearances and the number of consecutive
+        days it has been in the Item Shop.
+
+        Only the most recent dates are parsed, shop histories span hundreds
+        of appearances.
+        """
+
+        shopHistory = None
+        for key in ITEM_TYPES:
+            if key in item and item[key] is not None:
+                shopHistory = item[key][0]["shopHistory"]
+
+                break
+
+        if not shopHistory:
+            return 0, None, 0
+
+        appearances = len(shopHistory)
+        if appearances < 2:
+            return appearances, None, 1
+
+        current = datetime.fromisoformat(shopHistory[-1])
+        daysSince = (current - datetime.fromisoformat(shopHistory[-2])).days
+
+        streak = 1
+        for i in range(appearances - 2, -1, -1):
+            previous = datetime.fromisoformat(shopHistory[i])
+            if (current - previous).days == 1:
+                streak += 1
+                current = previous
+            else:
+                break
+
+        return appearances, daysSince, streak
+
+    def IconURLs(self, item: dict):
+        """Return the icon urls of the provided Item Shop entry, in order of preference."""
+
+        urls = []
+
+        if "bundle" in item and item["bundle"] is not None:
+            urls.append(item["bundle"]["image"])
+        else:
+            try:
+                urls.append(item["newDisplayAsset"]["renderImages"][0]["image"])
+            except Exception as e:
+                try:
+                    urls.append(item["newDisplayAsset"]["materialInstances"][0]["images"]["OfferImage"])
+                except Exception as e:
+                    log.warn(f"No offerimage or renderimage for {item.get('offerId')}.")
+
+        if "brItems" in item:
+            images = item["brItems"][0]["images"]
+            urls.extend(images.get(key) for key in ("featured", "icon", "smallIcon"))
+        elif "legoKits" in item:
+            urls.append(item["legoKits"][0]["images"].get("small"))
+        elif "instruments" in item:
+            urls.append(item["instruments"][0]["images"].get("large"))
+        elif "cars" in item:
+            urls.append(item["cars"][0]["images"].get("large"))
+
+        return [url for url in urls if url is not None]
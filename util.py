@@ -1,13 +1,50 @@
+import hashlib
+import io
 import json
 import locale
 import logging
+import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
+from time import perf_counter
+from urllib.parse import urlsplit
 
 import requests
-from PIL import Image, ImageFont
+from requests.adapters import HTTPAdapter
+from PIL import Image, ImageDraw, ImageFont
 
 log = logging.getLogger(__name__)
 
+# Keep-alive session of the current process, see Utility.Session
+_session = None
+
+
+@lru_cache(maxsize=None)
+def _truetype(path: str, size: int):
+    """Return the font object for the specified font file and size, loaded once per process."""
+
+    return ImageFont.truetype(path, size)
+
+
+@lru_cache(maxsize=4096)
+def _textWidth(font: ImageFont.FreeTypeFont, text: str):
+    """Return the width of the provided text when drawn with the specified font."""
+
+    return font.getsize(text)[0]
+
+
+@lru_cache(maxsize=4096)
+def _textMask(font: ImageFont.FreeTypeFont, text: str, mode: str, start: tuple):
+    """Return the rasterized mask of the provided text and its offset, see ImageUtil.Text."""
+
+    mask, offset = font.getmask2(text, mode, start=start)
+
+    # Kept as an image so that it is drawn through the public ImageDraw.bitmap
+    return Image.frombytes(mask.mode, mask.size, bytes(mask)), offset
+
 
 class Utility:
     """Class containing utilitarian functions intended to reduce duplicate code."""
@@ -18,7 +55,9 @@ class Utility:
         URL with the optionally provided header values.
         """
 
-        res = requests.get(url, headers=headers, params=parameters)
+        res = Utility.Session(self).get(
+            url, headers=headers, params=parameters, timeout=getattr(self, "requestTimeout", 30)
+        )
 
         # HTTP 200 (OK)
         if res.status_code == 200:
@@ -26,6 +65,26 @@ class Utility:
         else:
             log.critical(f"Failed to GET {url} (HTTP {res.status_code})")
 
+    def Session(self):
+        """
+        Return the keep-alive HTTP session of the current process.
+
+        Forked pool workers create their own session rather than reusing the
+        connections opened by the parent process.
+        """
+
+        global _session
+
+        if _session is None or _session[0] != os.getpid():
+            perHost = getattr(self, "prefetchPerHost", 8)
+            adapter = HTTPAdapter(pool_connections=perHost, pool_maxsize=perHost)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = (os.getpid(), session)
+
+        return _session[1]
+
     def nowISO(self):
         """Return the current utc time in ISO8601 timestamp format."""
 
@@ -76,23 +135,187 @@ class ImageUtil:
     def Download(self, url: str):
         """Download and return the raw file from the specified url as an image object."""
 
-        res = requests.get(url, stream=True)
+        data = ImageUtil.DownloadBytes(self, url)
 
+        if data is not None:
+            return Image.open(io.BytesIO(data))
+
+    def DownloadBytes(self, url: str):
+        """
+        Download and return the raw bytes of the file at the specified url.
+
+        If an icon cache is configured, previously downloaded files are
+        revalidated using their ETag and Last-Modified values instead of being
+        downloaded again.
+        """
+
+        cache = getattr(self, "cache", None)
+        cached = cache.Get(url) if cache is not None else None
+        headers = {}
+
+        if cached is not None:
+            data, meta = cached
+
+            if meta.get("etag") is not None:
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("lastModified") is not None:
+                headers["If-Modified-Since"] = meta["lastModified"]
+
+        res = Utility.Session(self).get(url, headers=headers, timeout=getattr(self, "requestTimeout", 30))
+
+        # HTTP 304 (Not Modified)
+        if res.status_code == 304 and cached is not None:
+            return data
         # HTTP 200 (OK)
-        if res.status_code == 200:
-            return Image.open(res.raw)
+        elif res.status_code == 200:
+            if cache is not None:
+                cache.Put(
+                    url,
+                    res.content,
+                    {
+                        "etag": res.headers.get("ETag"),
+                        "lastModified": res.headers.get("Last-Modified"),
+                    },
+                )
+
+            return res.content
         else:
             log.critical(f"Failed to GET {url} (HTTP {res.status_code})")
 
+    def Prefetch(self, candidates: list, labels: list = None):
+        """
+        Concurrently download the first available image of each provided list
+        of fallback urls, each url is only requested once.
+
+        If labels are provided, the time spent downloading the images of each
+        candidate is recorded to the metrics of the run with its labels.
+
+        Return a list containing the raw bytes of each resolved image, or None.
+        """
+
+        start = perf_counter()
+        perHost = getattr(self, "prefetchPerHost", 8)
+        limits = {}
+        elapsed = {}
+        lock = threading.Lock()
+
+        def fetch(url: str):
+            host = urlsplit(url).netloc
+
+            with lock:
+                limit = limits.setdefault(host, threading.BoundedSemaphore(perHost))
+
+            with limit:
+                requested = perf_counter()
+
+                try:
+                    data = ImageUtil.DownloadBytes(self, url)
+
+                    if data is not None:
+                        # Only parses the header, decoding is left to the workers
+                        Image.open(io.BytesIO(data))
+
+                    return data
+                except Exception as e:
+                    log.warning(f"Failed to prefetch {url}, {e}")
+                finally:
+                    elapsed[url] = perf_counter() - requested
+
+        results = [None] * len(candidates)
+        spent = [0] * len(candidates)
+        downloaded = {}
+        pending = list(range(len(candidates)))
+        depth = 0
+
+        with ThreadPoolExecutor(getattr(self, "prefetchWorkers", 16)) as executor:
+            while len(pending) > 0:
+                pending = [i for i in pending if depth < len(candidates[i])]
+                urls = [
+                    url
+                    for url in dict.fromkeys(candidates[i][depth] for i in pending)
+                    if url not in downloaded
+                ]
+                downloaded.update(zip(urls, executor.map(fetch, urls)))
+
+                remaining = []
+                for i in pending:
+                    data = downloaded[candidates[i][depth]]
+                    spent[i] += elapsed.get(candidates[i][depth], 0)
+
+                    if data is None:
+                        remaining.append(i)
+                    else:
+                        results[i] = data
+
+                pending = remaining
+                depth += 1
+
+        log.info(
+            f"Prefetched {len(downloaded)} unique images for {len(candidates)} items in {perf_counter() - start:.2f}s"
+        )
+
+        metrics = getattr(self, "metrics", None)
+        if metrics is not None and labels is not None:
+            for seconds, label in zip(spent, labels):
+                metrics.Add("card.download", seconds, **label)
+
+        return results
+
+    def RatioSize(self, size: tuple, maxWidth: int, maxHeight: int):
+        """Return the provided size scaled to cover the specified maximum width and height while maintaining aspect ratio."""
+
+        width, height = size
+        ratio = max(maxWidth / width, maxHeight / height)
+
+        return int(width * ratio), int(height * ratio)
+
     def RatioResize(self, image: Image.Image, maxWidth: int, maxHeight: int):
         """Resize and return the provided image while maintaining aspect ratio."""
 
-        ratio = max(maxWidth / image.width, maxHeight / image.height)
-
         return image.resize(
-            (int(image.width * ratio), int(image.height * ratio)), Image.ANTIALIAS
+            ImageUtil.RatioSize(self, image.size, maxWidth, maxHeight),
+            getattr(self, "resample", Image.LANCZOS),
         )
 
+    def DecodeResized(self, image: Image.Image, data: bytes, size: tuple):
+        """
+        Decode and return the provided opened image resized to the specified
+        size, using the cheapest way to get there.
+
+        A copy resized to the same size is reused from the cache if one is
+        configured. Otherwise JPEG images decode at the smallest fraction of
+        their size which is still larger than the target, and images many times
+        larger are reduced by an integer factor before being resampled.
+        """
+
+        cache = getattr(self, "cache", None)
+        resample = getattr(self, "resample", Image.LANCZOS)
+        reducingGap = getattr(self, "profile", {}).get("reducingGap", 3.0)
+        key = None
+
+        if cache is not None:
+            key = f"reduced:{hashlib.sha256(data).hexdigest()}:{size[0]}x{size[1]}:{resample}:{reducingGap}"
+            cached = cache.Get(key)
+
+            if cached is not None:
+                reduced = Image.open(io.BytesIO(cached[0]))
+                reduced.load()
+
+                return reduced
+
+        if image.format == "JPEG":
+            image.draft(image.mode, size)
+
+        # Beyond a gap of 3 the reduction is indistinguishable from resampling the full image
+        reduced = image.resize(size, resample, reducing_gap=reducingGap)
+
+        if key is not None and reduced.size != image.size:
+            buffer = io.BytesIO()
+            reduced.save(buffer, "PNG", compress_level=1)
+            cache.Put(key, buffer.getvalue())
+
+        return reduced
+
     def CenterX(self, foregroundWidth: int, backgroundWidth: int, distanceTop: int = 0):
         """Return the tuple necessary for horizontal centering and an optional vertical distance."""
 
@@ -107,13 +330,13 @@ class ImageUtil:
         """Return a font object with the specified font file and size."""
 
         try:
-            return ImageFont.truetype(f"{directory}{font}", size)
+            return _truetype(f"{directory}{font}", size)
         except OSError:
             log.warn(
                 "BurbankBigCondensed-Black.otf not found, defaulted font to LuckiestGuy-Regular.ttf"
             )
 
-            return ImageFont.truetype(f"{directory}LuckiestGuy-Regular.ttf", size)
+            return _truetype(f"{directory}LuckiestGuy-Regular.ttf", size)
         except Exception as e:
             log.error(f"Failed to load font, {e}")
 
@@ -126,17 +349,7 @@ class ImageUtil:
     ):
         """Return the font and width which fits the provided text within the specified maxiumum width."""
 
-        font = ImageUtil.Font(self, size)
-        textWidth, _ = font.getsize(text)
-        change = 0
-
-        while textWidth >= maxSize:
-            change += 1
-            size -= 1
-            font = ImageUtil.Font(self, size)
-            textWidth, _ = font.getsize(text)
-
-        return ImageUtil.Font(self, size), textWidth, change
+        return ImageUtil.FitText(self, ImageUtil.Font, font, text, size, maxSize)
 
     def TitleFont(
         self,
@@ -147,13 +360,13 @@ class ImageUtil:
         """Return a font object with the specified font file and size."""
 
         try:
-            return ImageFont.truetype(f"{directory}{font}", size)
+            return _truetype(f"{directory}{font}", size)
         except OSError:
             log.warn(
                 "BurbankBigBoldCondensed-Black.otf not found, defaulted font to LuckiestGuy-Regular.ttf"
             )
 
-            return ImageFont.truetype(f"{directory}LuckiestGuy-Regular.ttf", size)
+            return _truetype(f"{directory}LuckiestGuy-Regular.ttf", size)
         except Exception as e:
             log.error(f"Failed to load font, {e}")
 
@@ -166,15 +379,60 @@ class ImageUtil:
     ):
         """Return the font and width which fits the provided text within the specified maxiumum width."""
 
-        font = ImageUtil.Font(self, size)
-        textWidth, _ = font.getsize(text)
-        change = 0
+        return ImageUtil.FitText(self, ImageUtil.TitleFont, font, text, size, maxSize)
+
+    def FitText(self, loader, font: str, text: str, size: int, maxSize: int):
+        """
+        Return the largest font no bigger than the specified size which fits the
+        provided text within the specified maximum width, its text width and the
+        reduction in size.
+
+        The size is found using a binary search rather than shrinking one point
+        at a time, text widths grow with the font size.
+        """
+
+        textWidth = ImageUtil.TextWidth(self, loader(self, size, font), text)
+
+        if textWidth < maxSize:
+            return loader(self, size, font), textWidth, 0
+
+        low, high = 1, size - 1
+        best = 1
+
+        while low <= high:
+            middle = (low + high) // 2
+
+            if ImageUtil.TextWidth(self, loader(self, middle, font), text) < maxSize:
+                best = middle
+                low = middle + 1
+            else:
+                high = middle - 1
+
+        font = loader(self, best, font)
+
+        return font, ImageUtil.TextWidth(self, font, text), size - best
+
+    def Text(self, canvas: ImageDraw.ImageDraw, xy: tuple, text: str, fill: tuple, font: ImageFont.FreeTypeFont):
+        """
+        Draw the provided text onto the provided canvas, identical to canvas.text.
+
+        The glyphs of each font, text and subpixel start are only rasterized
+        once per process, cards draw the same labels, prices and countdowns.
+        """
+
+        coord = (int(xy[0]), int(xy[1]))
+        mask, offset = _textMask(font, text, canvas.fontmode, (math.modf(xy[0])[0], math.modf(xy[1])[0]))
+
+        canvas.bitmap((coord[0] + offset[0], coord[1] + offset[1]), mask, fill=fill)
+
+    def ClearCaches(self):
+        """Forget the fonts, text widths and text masks loaded by the current process."""
 
-        while textWidth >= maxSize:
-            change += 1
-            size -= 1
-            font = ImageUtil.Font(self, size)
-            textWidth, _ = font.getsize(text)
+        _truetype.cache_clear()
+        _textWidth.cache_clear()
+        _textMask.cache_clear()
 
-        return ImageUtil.Font(self, size), textWidth, change
+    def TextWidth(self, font: ImageFont.FreeTypeFont, text: str):
+        """Return the width of the provided text when drawn with the specified font."""
 
+        return _textWidth(font, text)